@@ -16,14 +16,19 @@ https://developer.barentswatch.no/docs/AIS/historic-ais-api
 import os
 import sys
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from datetime import datetime, timedelta, timezone
 
 # Import from lib
 from lib.config import CONFIG, USE_POSTGRES
 from lib.database import Database
-from lib.barentswatch_api import get_access_token, get_mmsi_list, fetch_and_store_track
+from lib.barentswatch_api import (
+    get_access_token, get_mmsi_list, get_ships_with_info, fetch_track, store_track, update_ships
+)
 from lib.weather import store_weather_data
-from lib.geo_utils import is_in_waiting_zone
+from lib.waiting import find_waiting_periods, max_in_window, next_index_after, to_epoch
 
 # Configure logging
 log_level = os.environ.get('LOG_LEVEL', 'INFO')
@@ -41,153 +46,226 @@ else:
     import sqlite3
 
 
+def map_ahead(pool, fn, items, ahead):
+    """
+    Run fn over items in a thread pool, yielding results in order
+
+    Unlike pool.map, which submits every item at once, at most ahead calls
+    run or wait beyond the result being handed out, so a slow consumer
+    doesn't make finished results pile up in memory.
+
+    Args:
+        pool: Executor to run the calls in
+        fn: Function of one item
+        items: Iterable of items
+        ahead: Number of calls kept in flight
+
+    Yields:
+        tuple: (item, fn(item)), in the order of items
+    """
+    items = iter(items)
+    pending = deque((item, pool.submit(fn, item)) for item in islice(items, ahead))
+    while pending:
+        item, future = pending.popleft()
+        for next_item in islice(items, 1):
+            pending.append((next_item, pool.submit(fn, next_item)))
+        yield item, future.result()
+
+
 def detect_waiting_events(db):
     """Analyze position data to detect ships waiting/loitering in zones"""
     logger.info("\nAnalyzing waiting events...")
 
-    # Get all ships with positions
-    db.execute('SELECT DISTINCT mmsi FROM positions')
-    mmsi_list = [row[0] for row in db.fetchall()]
-
-    waiting_events_detected = 0
-
-    for mmsi in mmsi_list:
-        # Get all positions for this ship, ordered by time
+    # Load wind observations once; each waiting period then looks up its
+    # window in memory instead of running its own weather query
+    weather_times = []
+    wind_speeds = []
+    if CONFIG['require_bad_weather']:
         db.execute('''
-            SELECT timestamp, latitude, longitude, sog
-            FROM positions
-            WHERE mmsi = %s
-            ORDER BY timestamp
-        ''' if db.use_postgres else '''
-            SELECT timestamp, latitude, longitude, sog
-            FROM positions
-            WHERE mmsi = ?
+            SELECT timestamp, wind_speed
+            FROM weather
+            WHERE wind_speed IS NOT NULL
             ORDER BY timestamp
-        ''', (mmsi,))
-
-        positions = db.fetchall()
-        if len(positions) < 2:
+        ''')
+        for timestamp, wind_speed in db.fetchall():
+            try:
+                weather_times.append(to_epoch(timestamp))
+            except (AttributeError, TypeError, ValueError) as e:
+                logger.error(f"Skipping weather observation with bad timestamp {timestamp!r}: {e}")
+                continue
+            wind_speeds.append(wind_speed)
+
+    # Load crossing times per ship so "did it cross later" is a bisect, not a query.
+    # Epoch seconds are searched; the stored values are kept for the insert.
+    crossing_epochs = {}
+    crossing_times = {}
+    db.execute('''
+        SELECT mmsi, crossing_time
+        FROM crossings
+        ORDER BY mmsi, crossing_time
+    ''')
+    for mmsi, crossing_time in db.fetchall():
+        try:
+            crossing_epoch = to_epoch(crossing_time)
+        except (AttributeError, TypeError, ValueError) as e:
+            logger.error(f"Skipping crossing of MMSI {mmsi} with bad timestamp {crossing_time!r}: {e}")
             continue
-
-        # Track waiting periods
-        waiting_start = None
-        waiting_zone = None
-        speeds_in_zone = []
-
-        for i, pos in enumerate(positions):
-            timestamp, lat, lon, sog = pos
-
-            # Check if in waiting zone
-            in_east = is_in_waiting_zone(lat, lon, CONFIG['waiting_zone_east'])
-            in_west = is_in_waiting_zone(lat, lon, CONFIG['waiting_zone_west'])
-
-            # Check speed threshold (if available)
-            is_slow = sog is not None and sog < CONFIG['loitering_speed_threshold']
-
-            if (in_east or in_west) and (sog is None or is_slow):
-                # Ship is in waiting zone
-                zone = 'east' if in_east else 'west'
-
-                if waiting_start is None:
-                    # Start of waiting period
-                    waiting_start = timestamp
-                    waiting_zone = zone
-                    speeds_in_zone = [sog] if sog is not None else []
-                elif zone == waiting_zone:
-                    # Continuing to wait in same zone
-                    if sog is not None:
-                        speeds_in_zone.append(sog)
+        crossing_epochs.setdefault(mmsi, []).append(crossing_epoch)
+        crossing_times.setdefault(mmsi, []).append(crossing_time)
+
+    # Positions are only appended, so each run continues from where the last one
+    # stopped (scan_state) instead of rescanning all history
+    db.execute('SELECT MAX(id) FROM positions')
+    max_position_id = db.fetchone()[0]
+    if max_position_id is None:
+        logger.info("✓ No positions to analyze")
+        return 0
+
+    db.execute('SELECT MAX(last_position_id) FROM scan_state')
+    scanned_position_id = db.fetchone()[0]
+
+    if scanned_position_id is None:
+        # First run: rebuild all waiting events from scratch
+        db.execute('DELETE FROM waiting_events')
+    else:
+        # Ships that got positions older than what was already scanned (backfill)
+        # are rescanned from the beginning
+        db.execute('''
+            SELECT p.mmsi
+            FROM positions p
+            JOIN scan_state s ON s.mmsi = p.mmsi
+            WHERE p.id > %s AND p.timestamp <= s.last_timestamp
+            GROUP BY p.mmsi
+        ''', (scanned_position_id,))
+        rescan = [(row[0],) for row in db.fetchall()]
+        if rescan:
+            logger.info(f"  Rescanning {len(rescan)} ships with backfilled positions")
+            db.executemany('DELETE FROM waiting_events WHERE mmsi = %s', rescan)
+            db.executemany('DELETE FROM scan_state WHERE mmsi = %s', rescan)
+
+    # Stream positions in one ordered scan; find_waiting_periods resets its state
+    # whenever the MMSI changes. Ships without scan state are read from the start,
+    # the others from their open waiting period or the period pending weather data
+    # (open_waiting_start, if any) or after their last position.
+    # Ships that have never been in a waiting zone cannot wait and are skipped.
+    positions = db.iterate('''
+        SELECT p.mmsi, p.timestamp, p.latitude, p.longitude, p.sog, p.in_east, p.in_west
+        FROM positions p
+        LEFT JOIN scan_state s ON s.mmsi = p.mmsi
+        WHERE p.id <= %s
+          AND p.mmsi IN (SELECT mmsi FROM positions WHERE in_east OR in_west)
+          AND (s.mmsi IS NULL
+               OR p.timestamp >= s.open_waiting_start
+               OR (s.open_waiting_start IS NULL AND p.timestamp > s.last_timestamp))
+        ORDER BY p.mmsi, p.timestamp
+    ''', (max_position_id,))
+
+    events_to_insert = []
+    track_ends = {}
+    # mmsi -> start of the ship's first period whose weather isn't fetched yet
+    pending_starts = {}
+
+    waiting_periods = find_waiting_periods(
+        positions,
+        CONFIG['waiting_zone_east'],
+        CONFIG['waiting_zone_west'],
+        CONFIG['loitering_speed_threshold'],
+        track_ends
+    )
+
+    for mmsi, waiting_zone, waiting_start, waiting_end, speeds_in_zone in waiting_periods:
+        if mmsi in pending_starts:
+            # Read again with the pending period on the next run
+            continue
+        try:
+            # Timestamps are strings on SQLite and datetimes on PostgreSQL; compare
+            # and subtract them as epoch seconds
+            start_epoch = to_epoch(waiting_start)
+            end_epoch = to_epoch(waiting_end)
+            duration_minutes = int((end_epoch - start_epoch) // 60)
+
+            # Check if duration meets threshold
+            if duration_minutes < CONFIG['loitering_time_threshold']:
+                continue
+
+            avg_speed = sum(speeds_in_zone) / len(speeds_in_zone) if speeds_in_zone else 0
+
+            # Check weather conditions during waiting period (if required)
+            weather_related = True
+            if CONFIG['require_bad_weather']:
+                max_wind = max_in_window(weather_times, wind_speeds, start_epoch, end_epoch)
+                if max_wind is not None:
+                    # Only consider weather-related if wind exceeded threshold
+                    weather_related = max_wind >= CONFIG['wind_threshold_ms']
+                elif not weather_times or weather_times[-1] < end_epoch:
+                    # Weather isn't fetched up to the end of the period yet (or the
+                    # fetch failed); judge the period on a later run
+                    pending_starts[mmsi] = waiting_start
+                    continue
                 else:
-                    # Changed zones, reset
-                    waiting_start = timestamp
-                    waiting_zone = zone
-                    speeds_in_zone = [sog] if sog is not None else []
-
-            else:
-                # Ship left waiting zone or sped up
-                if waiting_start is not None:
-                    # Calculate waiting duration
-                    waiting_end = timestamp
-                    try:
-                        # Handle both string and datetime objects
-                        if isinstance(waiting_start, str):
-                            start_dt = datetime.fromisoformat(waiting_start.replace('Z', '+00:00'))
-                        else:
-                            start_dt = waiting_start
-
-                        if isinstance(waiting_end, str):
-                            end_dt = datetime.fromisoformat(waiting_end.replace('Z', '+00:00'))
-                        else:
-                            end_dt = waiting_end
-
-                        duration_minutes = int((end_dt - start_dt).total_seconds() / 60)
-
-                        # Check if duration meets threshold
-                        if duration_minutes >= CONFIG['loitering_time_threshold']:
-                            avg_speed = sum(speeds_in_zone) / len(speeds_in_zone) if speeds_in_zone else 0
-
-                            # Check weather conditions during waiting period (if required)
-                            weather_related = True
-                            if CONFIG['require_bad_weather']:
-                                db.execute('''
-                                    SELECT AVG(wind_speed), MAX(wind_speed)
-                                    FROM weather
-                                    WHERE timestamp BETWEEN %s AND %s
-                                ''' if db.use_postgres else '''
-                                    SELECT AVG(wind_speed), MAX(wind_speed)
-                                    FROM weather
-                                    WHERE timestamp BETWEEN ? AND ?
-                                ''', (waiting_start, waiting_end))
-
-                                weather_row = db.fetchone()
-                                if weather_row and weather_row[0] is not None:
-                                    avg_wind = weather_row[0]
-                                    max_wind = weather_row[1]
-                                    # Only consider weather-related if wind exceeded threshold
-                                    weather_related = max_wind >= CONFIG['wind_threshold_ms']
-                                else:
-                                    # No weather data available, skip this waiting event
-                                    weather_related = False
-
-                            if weather_related:
-                                # Check if ship eventually crossed
-                                db.execute('''
-                                    SELECT crossing_time FROM crossings
-                                    WHERE mmsi = %s AND crossing_time > %s
-                                    ORDER BY crossing_time LIMIT 1
-                                ''' if db.use_postgres else '''
-                                    SELECT crossing_time FROM crossings
-                                    WHERE mmsi = ? AND crossing_time > ?
-                                    ORDER BY crossing_time LIMIT 1
-                                ''', (mmsi, waiting_end))
-
-                                crossing_row = db.fetchone()
-                                crossed = crossing_row is not None
-                                crossing_time = crossing_row[0] if crossed else None
-
-                                # Store waiting event
-                                db.execute('''
-                                    INSERT INTO waiting_events
-                                    (mmsi, zone, start_time, end_time, duration_minutes, avg_speed, crossed, crossing_time)
-                                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                                ''' if db.use_postgres else '''
-                                    INSERT INTO waiting_events
-                                    (mmsi, zone, start_time, end_time, duration_minutes, avg_speed, crossed, crossing_time)
-                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                                ''', (mmsi, waiting_zone, waiting_start, waiting_end, duration_minutes,
-                                      avg_speed, crossed, crossing_time))
-
-                                waiting_events_detected += 1
-
-                    except Exception as e:
-                        logger.error(f"Error processing waiting event: {e}")
-
-                # Reset waiting tracking
-                waiting_start = None
-                waiting_zone = None
-                speeds_in_zone = []
+                    # No weather data available, skip this waiting event
+                    weather_related = False
+
+            if weather_related:
+                # Check if ship eventually crossed
+                crossing_time = None
+                i = next_index_after(crossing_epochs.get(mmsi, []), end_epoch)
+                if i is not None:
+                    crossing_time = crossing_times[mmsi][i]
+                crossed = crossing_time is not None
+
+                events_to_insert.append((mmsi, waiting_zone, waiting_start, waiting_end,
+                                         duration_minutes, avg_speed, crossed, crossing_time))
+
+        except Exception as e:
+            logger.error(f"Error processing waiting event: {e}")
+
+    # Store all waiting events in one batch
+    if events_to_insert:
+        db.executemany('''
+            INSERT INTO waiting_events
+            (mmsi, zone, start_time, end_time, duration_minutes, avg_speed, crossed, crossing_time)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ''', events_to_insert)
+
+    # Ships with a pending period are read again from its start, like a period
+    # still open at the end of the track
+    for mmsi, pending_start in pending_starts.items():
+        track_ends[mmsi] = (track_ends[mmsi][0], pending_start)
+    if pending_starts:
+        logger.info(f"  {len(pending_starts)} ships have waiting periods pending weather data")
+
+    # Remember where each scanned ship stopped
+    if track_ends:
+        db.executemany('''
+            INSERT INTO scan_state (mmsi, last_timestamp, open_waiting_start, last_position_id)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (mmsi) DO UPDATE
+            SET last_timestamp = EXCLUDED.last_timestamp,
+                open_waiting_start = EXCLUDED.open_waiting_start,
+                last_position_id = EXCLUDED.last_position_id
+        ''' if db.use_postgres else '''
+            INSERT OR REPLACE INTO scan_state (mmsi, last_timestamp, open_waiting_start, last_position_id)
+            VALUES (?, ?, ?, ?)
+        ''', [(mmsi, last_timestamp, open_waiting_start, max_position_id)
+              for mmsi, (last_timestamp, open_waiting_start) in track_ends.items()])
+
+    # Earlier events are not rescanned, so mark those whose ship has crossed since
+    db.execute('''
+        UPDATE waiting_events
+        SET crossed = TRUE,
+            crossing_time = (
+                SELECT MIN(c.crossing_time) FROM crossings c
+                WHERE c.mmsi = waiting_events.mmsi AND c.crossing_time > waiting_events.end_time
+            )
+        WHERE NOT crossed AND EXISTS (
+            SELECT 1 FROM crossings c
+            WHERE c.mmsi = waiting_events.mmsi AND c.crossing_time > waiting_events.end_time
+        )
+    ''')
 
     db.commit()
+    waiting_events_detected = len(events_to_insert)
     logger.info(f"✓ Detected {waiting_events_detected} waiting events")
     return waiting_events_detected
 
@@ -196,76 +274,55 @@ def calculate_daily_stats(db):
     """Calculate and store daily statistics"""
     logger.info("\nCalculating daily statistics...")
 
-    # Get date range from data
-    db.execute('SELECT MIN(timestamp), MAX(timestamp) FROM positions')
-    date_range = db.fetchone()
-    if not date_range[0]:
+    # Nothing to do before the first positions are in
+    db.execute('SELECT 1 FROM positions LIMIT 1')
+    if not db.fetchone():
         return
 
-    # For each day, calculate stats
-    db.execute('''
-        SELECT DATE(crossing_time) as date,
-               COUNT(*) as crossings
-        FROM crossings
-        GROUP BY DATE(crossing_time)
-    ''' if db.use_postgres else '''
-        SELECT DATE(crossing_time) as date,
-               COUNT(*) as crossings
-        FROM crossings
-        GROUP BY DATE(crossing_time)
-    ''')
-
-    for row in db.fetchall():
-        date, crossings = row
-
-        # Get weather stats for this day
-        db.execute('''
-            SELECT AVG(wind_speed), MAX(wind_gust), AVG(wave_height)
-            FROM weather
-            WHERE DATE(timestamp) = %s
-        ''' if db.use_postgres else '''
-            SELECT AVG(wind_speed), MAX(wind_gust), AVG(wave_height)
+    # Aggregate each table once and join per day, so the whole update is a
+    # single statement instead of three queries and an upsert per day.
+    # Days are driven by crossings; weather and waiting stats are attached
+    # to the days that had crossings.
+    daily_select = '''
+        SELECT c.date, c.crossings, w.avg_wind, w.max_gust, w.avg_wave,
+               COALESCE(we.waiting_count, 0), we.avg_waiting
+        FROM (
+            SELECT DATE(crossing_time) AS date, COUNT(*) AS crossings
+            FROM crossings
+            GROUP BY DATE(crossing_time)
+        ) c
+        LEFT JOIN (
+            SELECT DATE(timestamp) AS date,
+                   AVG(wind_speed) AS avg_wind,
+                   MAX(wind_gust) AS max_gust,
+                   AVG(wave_height) AS avg_wave
             FROM weather
-            WHERE DATE(timestamp) = ?
-        ''', (date,))
-
-        weather_row = db.fetchone()
-        avg_wind = weather_row[0] if weather_row else None
-        max_gust = weather_row[1] if weather_row else None
-        avg_wave = weather_row[2] if weather_row else None
-
-        # Get waiting stats for this day
-        db.execute('''
-            SELECT COUNT(*), AVG(duration_minutes)
+            GROUP BY DATE(timestamp)
+        ) w ON w.date = c.date
+        LEFT JOIN (
+            SELECT DATE(start_time) AS date,
+                   COUNT(*) AS waiting_count,
+                   AVG(duration_minutes) AS avg_waiting
             FROM waiting_events
-            WHERE DATE(start_time) = %s
-        ''' if db.use_postgres else '''
-            SELECT COUNT(*), AVG(duration_minutes)
-            FROM waiting_events
-            WHERE DATE(start_time) = ?
-        ''', (date,))
-
-        waiting_row = db.fetchone()
-        waiting_count = waiting_row[0] if waiting_row else 0
-        avg_waiting = waiting_row[1] if waiting_row else None
+            GROUP BY DATE(start_time)
+        ) we ON we.date = c.date
+    '''
 
-        # Store daily stats
-        db.execute('''
-            INSERT INTO daily_stats
-            (date, total_crossings, avg_wind_speed, max_wind_gust, avg_wave_height, waiting_events, avg_waiting_time)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (date) DO UPDATE
-            SET total_crossings = EXCLUDED.total_crossings,
-                avg_wind_speed = EXCLUDED.avg_wind_speed,
-                max_wind_gust = EXCLUDED.max_wind_gust,
-                avg_wave_height = EXCLUDED.avg_wave_height,
-                waiting_events = EXCLUDED.waiting_events,
-                avg_waiting_time = EXCLUDED.avg_waiting_time
-        ''' if db.use_postgres else '''
-            INSERT OR REPLACE INTO daily_stats
-            (date, total_crossings, avg_wind_speed, max_wind_gust, avg_wave_height, waiting_events, avg_waiting_time)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (date, crossings, avg_wind, max_gust, avg_wave, waiting_count, avg_waiting))
+    db.execute('''
+        INSERT INTO daily_stats
+        (date, total_crossings, avg_wind_speed, max_wind_gust, avg_wave_height, waiting_events, avg_waiting_time)
+    ''' + daily_select + '''
+        ON CONFLICT (date) DO UPDATE
+        SET total_crossings = EXCLUDED.total_crossings,
+            avg_wind_speed = EXCLUDED.avg_wind_speed,
+            max_wind_gust = EXCLUDED.max_wind_gust,
+            avg_wave_height = EXCLUDED.avg_wave_height,
+            waiting_events = EXCLUDED.waiting_events,
+            avg_waiting_time = EXCLUDED.avg_waiting_time
+    ''' if db.use_postgres else '''
+        INSERT OR REPLACE INTO daily_stats
+        (date, total_crossings, avg_wind_speed, max_wind_gust, avg_wave_height, waiting_events, avg_waiting_time)
+    ''' + daily_select)
 
     db.commit()
     logger.info("✓ Daily statistics updated")
@@ -273,21 +330,15 @@ def calculate_daily_stats(db):
 
 def print_summary(db):
     """Print summary statistics"""
-    db.execute('SELECT COUNT(DISTINCT mmsi) FROM positions')
-    ships_with_data = db.fetchone()[0]
-
-    db.execute('SELECT COUNT(DISTINCT mmsi) FROM crossings')
-    ships_crossed = db.fetchone()[0]
-
-    db.execute('SELECT COUNT(*) FROM crossings')
-    total_crossings = db.fetchone()[0]
-
-    db.execute('SELECT COUNT(*) FROM waiting_events')
-    total_waiting = db.fetchone()[0]
-
-    db.execute('SELECT AVG(duration_minutes) FROM waiting_events')
-    avg_wait_row = db.fetchone()
-    avg_wait_time = avg_wait_row[0] if avg_wait_row[0] else 0
+    # All totals in one round-trip, scanning each table once
+    db.execute('''
+        SELECT p.ships, c.ships, c.total, w.total, w.avg_wait
+        FROM (SELECT COUNT(DISTINCT mmsi) AS ships FROM positions) p,
+             (SELECT COUNT(DISTINCT mmsi) AS ships, COUNT(*) AS total FROM crossings) c,
+             (SELECT COUNT(*) AS total, AVG(duration_minutes) AS avg_wait FROM waiting_events) w
+    ''')
+    ships_with_data, ships_crossed, total_crossings, total_waiting, avg_wait_time = db.fetchone()
+    avg_wait_time = avg_wait_time or 0
 
     logger.info(f'\n=== SUMMARY ===')
     logger.info(f'Ships with track data: {ships_with_data}')
@@ -333,38 +384,45 @@ def find_oldest_missing_date(db, lookback_days=14):
     now = datetime.now(timezone.utc)
     target_start = now - timedelta(days=lookback_days)
 
-    # Get all distinct dates we have data for in the target period
+    # Generate every day in the period and probe each with an indexed range
+    # check, instead of scanning DISTINCT DATE(timestamp) over all recent rows
+    first_day = target_start.date().isoformat()
+    last_day = now.date().isoformat()
+
     db.execute('''
-        SELECT DISTINCT DATE(timestamp) as date
-        FROM positions
-        WHERE timestamp >= %s
-        ORDER BY date
+        SELECT MIN(d)
+        FROM generate_series(%s::timestamptz, %s::timestamptz, interval '1 day') AS d
+        WHERE NOT EXISTS (
+            SELECT 1 FROM positions
+            WHERE timestamp >= d AND timestamp < d + interval '1 day'
+        )
     ''' if db.use_postgres else '''
-        SELECT DISTINCT DATE(timestamp) as date
-        FROM positions
-        WHERE timestamp >= ?
-        ORDER BY date
-    ''', (target_start,))
-
-    existing_dates = set()
-    for row in db.fetchall():
-        date_val = row[0]
-        if isinstance(date_val, str):
-            date_val = datetime.fromisoformat(date_val).date()
-        existing_dates.add(date_val)
-
-    # Check each day from target_start to now
-    current = target_start.date()
-    today = now.date()
-
-    while current <= today:
-        if current not in existing_dates:
-            # Found oldest missing date
-            return datetime.combine(current, datetime.min.time()).replace(tzinfo=timezone.utc)
-        current += timedelta(days=1)
-
-    # All dates have data
-    return None
+        WITH RECURSIVE days(d) AS (
+            SELECT ?
+            UNION ALL
+            SELECT DATE(d, '+1 day') FROM days WHERE d < ?
+        )
+        SELECT MIN(d)
+        FROM days
+        WHERE NOT EXISTS (
+            SELECT 1 FROM positions
+            WHERE timestamp >= d AND timestamp < DATE(d, '+1 day')
+        )
+    ''', (f'{first_day}T00:00:00+00:00', f'{last_day}T00:00:00+00:00') if db.use_postgres
+        else (first_day, last_day))
+
+    missing = db.fetchone()[0]
+    if missing is None:
+        # All dates have data
+        return None
+
+    if isinstance(missing, str):
+        missing = datetime.fromisoformat(missing).date()
+    else:
+        missing = missing.astimezone(timezone.utc).date()
+
+    # Found oldest missing date
+    return datetime.combine(missing, datetime.min.time()).replace(tzinfo=timezone.utc)
 
 
 def determine_fetch_timerange(db):
@@ -423,26 +481,42 @@ def main():
         processed = 0
         new_data = 0
 
-        for i, mmsi in enumerate(mmsi_list):
-            result = fetch_and_store_track(db, access_token, mmsi, msgtimefrom, msgtimeto, CONFIG)
+        # Look up once which ships already have static info, instead of per track
+        ships_with_info = get_ships_with_info(db, CONFIG['ship_info_retry_days'])
+        # Name/type refreshes for known ships, written in one batch after the loop
+        ship_updates = {}
+
+        # Tracks are fetched over HTTP in worker threads; the database connection
+        # is not thread-safe, so storing happens here as results come in (in order).
+        # The loop can outlast a token, so each fetch takes the current (cached) one.
+        def fetch(mmsi):
+            return fetch_track(get_access_token(CONFIG), mmsi, msgtimefrom, msgtimeto, CONFIG)
+
+        # Storing is slower than fetching (new ships wait for the Marinesia rate
+        # limit), so only a couple of tracks per worker are fetched ahead
+        workers = CONFIG['fetch_workers']
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for i, (mmsi, track) in enumerate(map_ahead(pool, fetch, mmsi_list, 2 * workers)):
+                if track is None:
+                    logger.info(f'[{i+1}/{len(mmsi_list)}] MMSI {mmsi} - no data')
+                else:
+                    success, ship_name, ship_type, positions, crossings = store_track(db, mmsi, track, CONFIG, ships_with_info, ship_updates)
+                    new_data += 1
+                    logger.info(f'[{i+1}/{len(mmsi_list)}] {ship_name} ({ship_type}) - {positions} positions')
 
-            if result is False:
-                logger.info(f'[{i+1}/{len(mmsi_list)}] MMSI {mmsi} - already in database or no data')
-            else:
-                success, ship_name, ship_type, positions, crossings = result
-                new_data += 1
-                logger.info(f'[{i+1}/{len(mmsi_list)}] {ship_name} ({ship_type}) - {positions} positions')
+                processed += 1
 
-            processed += 1
+        update_ships(db, ship_updates)
 
         logger.info(f"\n✓ Processed {processed} MMSIs ({new_data} new)")
 
+        # Fetch and store weather data (before waiting detection, which only
+        # evaluates each waiting period once)
+        store_weather_data(db, msgtimefrom, msgtimeto, CONFIG)
+
         # Analyze waiting events
         detect_waiting_events(db)
 
-        # Fetch and store weather data
-        store_weather_data(db, msgtimefrom, msgtimeto, CONFIG)
-
         # Calculate daily statistics
         calculate_daily_stats(db)
 
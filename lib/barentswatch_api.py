@@ -2,22 +2,141 @@
 Barentswatch API integration for AIS data
 """
 
+import json
 import logging
-import requests
+import os
 import time
-from lib.geo_utils import line_segments_intersect, distance_to_stad_line
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lib.geo_utils import ccw, line_side, stad_line_bbox, stad_line_distance
 from lib.config import get_ship_type_name
+from lib.fast_json import response_json
 from lib.ship_lookup import get_ship_info
+from lib.waiting import zone_classifier
 
 logger = logging.getLogger(__name__)
 
-
-def get_access_token(config):
+# Shared HTTP session: keeps TLS connections to Barentswatch alive between
+# requests (including from the track fetch worker threads) and retries
+# transient server errors. requests already sends Accept-Encoding: gzip.
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504),
+                      raise_on_status=False)
+))
+
+# Statements used while storing a track, kept as constants so the dialect
+# is picked once per track
+POSITION_COLUMNS = ('mmsi', 'timestamp', 'latitude', 'longitude', 'sog', 'cog', 'heading',
+                    'in_east', 'in_west')
+# On PostgreSQL positions are COPYed into a session-local staging table and
+# moved over with one INSERT, since COPY itself cannot skip duplicates
+CREATE_POSITIONS_STAGING_PG = '''
+    CREATE TEMP TABLE IF NOT EXISTS positions_staging (
+        mmsi BIGINT,
+        timestamp TIMESTAMP WITH TIME ZONE,
+        latitude REAL,
+        longitude REAL,
+        sog REAL,
+        cog REAL,
+        heading INTEGER,
+        in_east BOOLEAN,
+        in_west BOOLEAN
+    ) ON COMMIT DELETE ROWS
+'''
+INSERT_POSITIONS_FROM_STAGING_PG = '''
+    INSERT INTO positions (mmsi, timestamp, latitude, longitude, sog, cog, heading, in_east, in_west)
+    SELECT mmsi, timestamp, latitude, longitude, sog, cog, heading, in_east, in_west
+    FROM positions_staging
+    ON CONFLICT (mmsi, timestamp) DO NOTHING
+'''
+INSERT_POSITION_SQLITE = '''
+    INSERT OR IGNORE INTO positions (mmsi, timestamp, latitude, longitude, sog, cog, heading, in_east, in_west)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+# Moves a ship's latest position forward, never back to an older one
+UPSERT_LATEST_POSITION = '''
+    INSERT INTO latest_positions (mmsi, timestamp, latitude, longitude, sog, cog, heading)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (mmsi) DO UPDATE
+    SET timestamp = EXCLUDED.timestamp,
+        latitude = EXCLUDED.latitude,
+        longitude = EXCLUDED.longitude,
+        sog = EXCLUDED.sog,
+        cog = EXCLUDED.cog,
+        heading = EXCLUDED.heading
+    WHERE EXCLUDED.timestamp > latest_positions.timestamp
+'''
+# Refreshes name and type only, leaving looked-up ship info untouched
+UPSERT_SHIP_BASICS = '''
+    INSERT INTO ships (mmsi, name, ship_type, ship_type_name)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (mmsi) DO UPDATE
+    SET name = EXCLUDED.name,
+        ship_type = EXCLUDED.ship_type,
+        ship_type_name = EXCLUDED.ship_type_name
+'''
+INSERT_CROSSING_PG = '''
+    INSERT INTO crossings (mmsi, crossing_time, crossing_lat, crossing_lon, direction)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (mmsi, crossing_time) DO NOTHING
+'''
+INSERT_CROSSING_SQLITE = '''
+    INSERT OR IGNORE INTO crossings (mmsi, crossing_time, crossing_lat, crossing_lon, direction)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+
+# Access tokens obtained in this process: client_id -> (access_token, expires_at)
+_TOKENS = {}
+# Track fetch workers may all find their token expired at once; only one
+# of them authenticates again
+_TOKENS_LOCK = Lock()
+
+
+def _read_cached_token(path, client_id):
+    """Return (access_token, expires_at) from the cache file, or None if missing or for other credentials"""
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if cached.get('client_id') != client_id or not cached.get('access_token'):
+        return None
+    return cached['access_token'], cached.get('expires_at', 0)
+
+
+def _write_cached_token(path, client_id, access_token, expires_in):
+    """Store an access token and its expiry time, readable by the owner only"""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'client_id': client_id,
+                'access_token': access_token,
+                'expires_at': time.time() + expires_in
+            }, f)
+    except OSError as e:
+        logger.warning(f"Could not cache access token: {e}")
+
+
+def get_access_token(config, rejected=None):
     """
     Authenticate with Barentswatch and get access token
 
+    Tokens are reused until shortly before they expire: within the process,
+    and, if config has a 'token_cache_file', across runs. Thread-safe.
+
     Args:
         config: Configuration dict with client_id, client_secret, and auth_url
+        rejected: Token the API answered 401 to; it is not reused even if it
+                  should still be valid
 
     Returns:
         str: Access token
@@ -25,16 +144,35 @@ def get_access_token(config):
     Raises:
         Exception: If authentication fails
     """
+    with _TOKENS_LOCK:
+        return _get_access_token(config, rejected)
+
+
+def _get_access_token(config, rejected):
+    """get_access_token without the lock"""
+    client_id = config['client_id']
+    cached = _TOKENS.get(client_id)
+    if cached and cached[0] != rejected and cached[1] - time.time() >= 60:
+        return cached[0]
+
+    cache_path = config.get('token_cache_file')
+    if cache_path:
+        cached = _read_cached_token(cache_path, client_id)
+        if cached and cached[0] != rejected and cached[1] - time.time() >= 60:
+            logger.info("✓ Using cached access token")
+            _TOKENS[client_id] = cached
+            return cached[0]
+
     logger.info("Authenticating with Barentswatch...")
 
     data = {
-        'client_id': config['client_id'],
+        'client_id': client_id,
         'client_secret': config['client_secret'],
         'scope': 'ais',
         'grant_type': 'client_credentials'
     }
 
-    response = requests.post(
+    response = SESSION.post(
         config['auth_url'],
         data=data,
         headers={'Content-Type': 'application/x-www-form-urlencoded'}
@@ -46,6 +184,13 @@ def get_access_token(config):
 
     token_data = response.json()
     logger.info("✓ Authenticated successfully")
+
+    if token_data.get('expires_in'):
+        _TOKENS[client_id] = (token_data['access_token'], time.time() + token_data['expires_in'])
+        if cache_path:
+            _write_cached_token(cache_path, client_id, token_data['access_token'],
+                                token_data['expires_in'])
+
     return token_data['access_token']
 
 
@@ -90,22 +235,24 @@ def get_mmsi_list(access_token, msgtimefrom, msgtimeto, config):
         'Content-Type': 'application/json'
     }
 
-    response = requests.post(config['mmsi_area_url'], headers=headers, json=data)
+    response = SESSION.post(config['mmsi_area_url'], headers=headers, json=data)
 
     if response.status_code != 200:
         raise Exception(f"Failed to fetch MMSI list: {response.status_code} - {response.text}")
 
-    mmsi_list = response.json()
+    mmsi_list = response_json(response)
     logger.info(f"✓ Found {len(mmsi_list)} MMSIs")
     return mmsi_list
 
 
-def fetch_and_store_track(db, access_token, mmsi, msgtimefrom, msgtimeto, config):
+def fetch_track(access_token, mmsi, msgtimefrom, msgtimeto, config):
     """
-    Fetch track data for a single MMSI and store in database
+    Fetch track data for a single MMSI
+
+    Only does HTTP, so it is safe to call from worker threads. If the token
+    has expired (401), a new one is fetched and the request retried once.
 
     Args:
-        db: Database instance
         access_token: Barentswatch API access token
         mmsi: Ship MMSI number
         msgtimefrom: Start time (ISO format string)
@@ -113,30 +260,119 @@ def fetch_and_store_track(db, access_token, mmsi, msgtimefrom, msgtimeto, config
         config: Configuration dict with API settings
 
     Returns:
-        tuple: (success, ship_name, ship_type_name, positions_stored, crossings_detected)
-               or False if fetch failed
+        list: Position dicts from the API, or None if fetch failed or track is empty
     """
-    start_time = time.time()
-
-    # Fetch track from API with date range
     url = f"{config['track_url']}/{mmsi}/{msgtimefrom}/{msgtimeto}"
     headers = {
         'Authorization': f'Bearer {access_token}',
         'Content-Type': 'application/json'
     }
 
-    api_start = time.time()
-    response = requests.get(url, headers=headers)
-    api_time = time.time() - api_start
+    response = SESSION.get(url, headers=headers)
+
+    if response.status_code == 401:
+        headers['Authorization'] = f'Bearer {get_access_token(config, rejected=access_token)}'
+        response = SESSION.get(url, headers=headers)
+        if response.status_code == 401:
+            logger.warning(f"Track for MMSI {mmsi} refused even with a new access token")
 
     if response.status_code != 200:
-        return False
+        return None
 
-    positions = response.json()
+    positions = response_json(response)
 
     if not positions or not isinstance(positions, list):
+        return None
+
+    return positions
+
+
+def fetch_and_store_track(db, access_token, mmsi, msgtimefrom, msgtimeto, config):
+    """
+    Fetch track data for a single MMSI and store in database
+
+    Args:
+        db: Database instance
+        access_token: Barentswatch API access token
+        mmsi: Ship MMSI number
+        msgtimefrom: Start time (ISO format string)
+        msgtimeto: End time (ISO format string)
+        config: Configuration dict with API settings
+
+    Returns:
+        tuple: (success, ship_name, ship_type_name, positions_stored, crossings_detected)
+               or False if fetch failed
+    """
+    positions = fetch_track(access_token, mmsi, msgtimefrom, msgtimeto, config)
+    if positions is None:
         return False
+    return store_track(db, mmsi, positions, config)
+
+
+def get_ships_with_info(db, retry_days=None):
+    """
+    Get the MMSIs whose static ship info has already been looked up
+
+    Failed lookups are recorded too (ship_info_fetched_at set, no length), so
+    ships Marinesia doesn't know are not looked up again on every run.
+
+    Args:
+        db: Database instance
+        retry_days: Optional. If given, ships whose lookup found no length more
+                    than this many days ago are left out, so they are retried.
 
+    Returns:
+        set: MMSIs with ship_info_fetched_at set
+    """
+    if retry_days is None:
+        db.execute('SELECT mmsi FROM ships WHERE ship_info_fetched_at IS NOT NULL')
+    else:
+        # Same text format as SQLite's datetime('now'), so the comparison works on both
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=retry_days)).strftime('%Y-%m-%d %H:%M:%S')
+        db.execute('''
+            SELECT mmsi FROM ships
+            WHERE ship_info_fetched_at IS NOT NULL
+              AND (length IS NOT NULL OR ship_info_fetched_at >= %s)
+        ''', (cutoff,))
+    return {row[0] for row in db.fetchall()}
+
+
+def update_ships(db, ship_updates):
+    """
+    Write deferred ship name/type updates collected by store_track in one batch
+
+    Args:
+        db: Database instance
+        ship_updates: Dict of mmsi -> (mmsi, name, ship_type, ship_type_name)
+
+    Returns:
+        int: Number of ships updated
+    """
+    if ship_updates:
+        db.executemany(UPSERT_SHIP_BASICS, list(ship_updates.values()))
+        db.commit()
+    return len(ship_updates)
+
+
+def store_track(db, mmsi, positions, config, ships_with_info=None, ship_updates=None):
+    """
+    Store a fetched track in database and detect Stad crossings
+
+    Args:
+        db: Database instance
+        mmsi: Ship MMSI number
+        positions: Non-empty list of position dicts from fetch_track
+        config: Configuration dict with API settings
+        ships_with_info: Optional set from get_ships_with_info, shared across calls
+                         (updated in place). If None, the database is queried.
+        ship_updates: Optional dict. If given, name/type updates for ships already
+                      in the database are collected here instead of written, to be
+                      flushed with update_ships(). New ships are always written
+                      right away, since their positions reference them.
+
+    Returns:
+        tuple: (success, ship_name, ship_type_name, positions_stored, crossings_detected)
+    """
     # Extract ship info from first position
     ship_name = positions[0].get('name') or f'Unknown-{mmsi}'
     # Clean up empty/whitespace names
@@ -147,13 +383,13 @@ def fetch_and_store_track(db, access_token, mmsi, msgtimefrom, msgtimeto, config
 
     # Check if we need to fetch ship info from Marinesia API
     # Only fetch if we haven't tried before (ship_info_fetched_at IS NULL)
-    if db.use_postgres:
-        db.execute('SELECT ship_info_fetched_at FROM ships WHERE mmsi = %s', (mmsi,))
+    if ships_with_info is not None:
+        should_fetch_ship_info = mmsi not in ships_with_info
     else:
-        db.execute('SELECT ship_info_fetched_at FROM ships WHERE mmsi = ?', (mmsi,))
+        db.execute('SELECT ship_info_fetched_at FROM ships WHERE mmsi = %s', (mmsi,))
 
-    existing_ship = db.fetchone()
-    should_fetch_ship_info = (existing_ship is None or existing_ship[0] is None)
+        existing_ship = db.fetchone()
+        should_fetch_ship_info = (existing_ship is None or existing_ship[0] is None)
 
     if should_fetch_ship_info:
         # Fetch static ship data from Marinesia API
@@ -191,94 +427,103 @@ def fetch_and_store_track(db, access_token, mmsi, msgtimefrom, msgtimeto, config
                 INSERT OR REPLACE INTO ships (mmsi, name, ship_type, ship_type_name, destination, callsign, length, width, ship_info_fetched_at)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
             ''', (mmsi, ship_name, ship_type, ship_type_name, destination, callsign, length, width))
+
+        if ships_with_info is not None:
+            ships_with_info.add(mmsi)
+    elif ship_updates is not None:
+        # Ship info already fetched and the row exists; update basic info later in bulk
+        ship_updates[mmsi] = (mmsi, ship_name, ship_type, ship_type_name)
     else:
         # Ship info already fetched, just update basic info without touching length/width/callsign
-        if db.use_postgres:
-            db.execute('''
-                INSERT INTO ships (mmsi, name, ship_type, ship_type_name)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (mmsi) DO UPDATE
-                SET name = EXCLUDED.name,
-                    ship_type = EXCLUDED.ship_type,
-                    ship_type_name = EXCLUDED.ship_type_name
-            ''', (mmsi, ship_name, ship_type, ship_type_name))
-        else:
-            db.execute('''
-                INSERT INTO ships (mmsi, name, ship_type, ship_type_name)
-                VALUES (?, ?, ?, ?)
-                ON CONFLICT (mmsi) DO UPDATE
-                SET name = EXCLUDED.name,
-                    ship_type = EXCLUDED.ship_type,
-                    ship_type_name = EXCLUDED.ship_type_name
-            ''', (mmsi, ship_name, ship_type, ship_type_name))
+        db.execute(UPSERT_SHIP_BASICS, (mmsi, ship_name, ship_type, ship_type_name))
 
     # Process positions and check for crossings
-    crossings_detected = 0
-    prev_pos = None
-    positions_stored = 0
+    if db.use_postgres:
+        insert_crossing_sql = INSERT_CROSSING_PG
+    else:
+        insert_crossing_sql = INSERT_CROSSING_SQLITE
+
+    # Waiting zone membership is stored with each position so later detection
+    # runs don't have to recompute it
+    classify_zone = zone_classifier(config['waiting_zone_east'], config['waiting_zone_west'])
+
+    # The Stad line is fixed, so which side of it each position lies on is
+    # computed once per position and reused for both segments it belongs to
+    line_start = config['stad_line_start']
+    line_end = config['stad_line_end']
+    stad_side = line_side(line_start, line_end)
+    min_lon, max_lon = sorted((line_start[0], line_end[0]))
+    min_lat, max_lat = sorted((line_start[1], line_end[1]))
+    distance_to_stad = stad_line_distance(line_start, line_end)
+    # Positions outside this box are more than 50 km away without measuring
+    near_min_lat, near_max_lat, near_min_lon, near_max_lon = stad_line_bbox(line_start, line_end, 50)
+
+    position_rows = []
+    crossing_rows = []
+    prev_point = None
+    prev_side = None
     positions_filtered = 0
+    last_index = len(positions) - 1
 
     for i, pos in enumerate(positions):
         lat = pos.get('latitude')
         lon = pos.get('longitude')
-        timestamp = pos.get('msgtime')
-        sog = pos.get('speedOverGround')
-        cog = pos.get('courseOverGround')
-        heading = pos.get('trueHeading')
 
         if lat is not None and lon is not None:
+            timestamp = pos.get('msgtime')
+
             # Check if this is the last position
-            is_last_position = (i == len(positions) - 1)
+            is_last_position = (i == last_index)
 
             # Only store positions within 50km of Stad line, OR the last position (for map display)
-            distance = distance_to_stad_line(lat, lon, config['stad_line_start'], config['stad_line_end'])
-            if distance <= 50 or is_last_position:
+            near_stad = (near_min_lat <= lat <= near_max_lat and near_min_lon <= lon <= near_max_lon
+                         and distance_to_stad(lat, lon) <= 50)
+            if near_stad or is_last_position:
                 # Store position
-                db.execute('''
-                    INSERT INTO positions (mmsi, timestamp, latitude, longitude, sog, cog, heading)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (mmsi, timestamp) DO NOTHING
-                ''' if db.use_postgres else '''
-                    INSERT OR IGNORE INTO positions (mmsi, timestamp, latitude, longitude, sog, cog, heading)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (mmsi, timestamp, lat, lon, sog, cog, heading))
-                positions_stored += 1
-                if is_last_position and distance > 50:
+                in_east, in_west = classify_zone(lat, lon)
+                position_rows.append((mmsi, timestamp, lat, lon, pos.get('speedOverGround'),
+                                      pos.get('courseOverGround'), pos.get('trueHeading'), in_east, in_west))
+                if not near_stad:
                     logger.debug(f"  Stored last position even though >50km from Stad")
             else:
                 positions_filtered += 1
 
-            # Check for Stad crossing
-            if prev_pos is not None:
-                curr_point = (lon, lat)
-                prev_point = (prev_pos['longitude'], prev_pos['latitude'])
-
-                if line_segments_intersect(prev_point, curr_point,
-                                         config['stad_line_start'],
-                                         config['stad_line_end']):
-                    direction = 'E->W' if prev_pos['longitude'] > lon else 'W->E'
-
-                    db.execute('''
-                        INSERT INTO crossings (mmsi, crossing_time, crossing_lat, crossing_lon, direction)
-                        VALUES (%s, %s, %s, %s, %s)
-                        ON CONFLICT (mmsi, crossing_time) DO NOTHING
-                    ''' if db.use_postgres else '''
-                        INSERT OR IGNORE INTO crossings (mmsi, crossing_time, crossing_lat, crossing_lon, direction)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (mmsi, timestamp, lat, lon, direction))
-
-                    crossings_detected += 1
+            # Check for Stad crossing (same test as line_segments_intersect): the
+            # ship changed side of the line, and the line's ends lie on opposite
+            # sides of the ship's movement
+            curr_point = (lon, lat)
+            curr_side = stad_side(curr_point)
+            if prev_point is not None and curr_side != prev_side:
+                prev_lon, prev_lat = prev_point
+                # Both ends beyond the same edge of the line's bounding box: the
+                # ship crossed the line's extension, not the line itself
+                outside_box = ((lon < min_lon and prev_lon < min_lon) or (lon > max_lon and prev_lon > max_lon)
+                               or (lat < min_lat and prev_lat < min_lat) or (lat > max_lat and prev_lat > max_lat))
+
+                if not outside_box and ccw(prev_point, curr_point, line_start) != ccw(prev_point, curr_point, line_end):
+                    direction = 'E->W' if prev_lon > lon else 'W->E'
+
+                    crossing_rows.append((mmsi, timestamp, lat, lon, direction))
                     logger.info(f"  *** CROSSING: {ship_name} ({direction}) at {timestamp}")
 
-            prev_pos = pos
+            prev_point = curr_point
+            prev_side = curr_side
 
-    db_start = time.time()
+    # Write the whole track in one batch per table
+    if position_rows:
+        if db.use_postgres:
+            db.execute(CREATE_POSITIONS_STAGING_PG)
+            db.copy_rows('positions_staging', POSITION_COLUMNS, position_rows)
+            db.execute(INSERT_POSITIONS_FROM_STAGING_PG)
+        else:
+            db.executemany(INSERT_POSITION_SQLITE, position_rows)
+        # The track is in time order and its last position is always stored
+        db.execute(UPSERT_LATEST_POSITION, position_rows[-1][:7])
+    if crossing_rows:
+        db.executemany(insert_crossing_sql, crossing_rows)
     db.commit()
-    db_time = time.time() - db_start
-
-    total_time = time.time() - start_time
 
     if positions_filtered > 0:
         logger.info(f"  📍 Filtered {positions_filtered}/{len(positions)} positions (>50km from Stad)")
 
-    return True, ship_name, ship_type_name, positions_stored, crossings_detected
+    return True, ship_name, ship_type_name, len(position_rows), len(crossing_rows)
@@ -4,16 +4,10 @@ Configuration module for Stadthavet AIS tracking system
 
 import os
 from pathlib import Path
+from lib.env import load_env
 
 # Load .env file if it exists (for local development)
-env_path = Path(__file__).parent.parent / '.env'
-if env_path.exists():
-    with open(env_path) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                os.environ.setdefault(key, value)
+load_env(Path(__file__).parent.parent / '.env')
 
 # Database detection - use PostgreSQL on render.com, SQLite locally
 USE_POSTGRES = os.environ.get('RENDER') is not None or os.environ.get('DATABASE_URL') is not None
@@ -31,6 +25,8 @@ CONFIG = {
     'mmsi_area_url': 'https://historic.ais.barentswatch.no/v1/historic/mmsiinarea',
     'track_url': 'https://historic.ais.barentswatch.no/v1/historic/tracks',
     'latest_url': 'https://live.ais.barentswatch.no/v1/latest',
+    # Access token is kept here between runs until it expires
+    'token_cache_file': os.environ.get('BARENTSWATCH_TOKEN_CACHE', '.barentswatch_token.json'),
 
     # Stadthavet bounding box - reduced to ~50km around Stad line
     # Stad line runs from (62.19, 5.10) to (62.44, 4.34)
@@ -43,6 +39,9 @@ CONFIG = {
 
     # Waiting zones (ships waiting for weather to improve)
     # Positioned in open water, away from ports/quays
+    # Zone membership is stored per position (positions.in_east/in_west); after
+    # moving a zone, reset it with: UPDATE positions SET in_east = NULL, in_west = NULL
+    # and rebuild waiting events with: DELETE FROM scan_state
     # East side of Stad (waiting to cross westward) - between Stad and Ålesund
     'waiting_zone_east': {
         'center_lat': 62.25,
@@ -64,6 +63,12 @@ CONFIG = {
     'wind_threshold_ms': 10.0,         # m/s - above this is considered bad weather for crossing
     'require_bad_weather': True,       # Only count waiting if weather was actually bad
 
+    # Ships Marinesia had no data for are looked up again after this many days
+    'ship_info_retry_days': int(os.environ.get('SHIP_INFO_RETRY_DAYS', '30')),
+
+    # Number of tracks fetched from the API in parallel
+    'fetch_workers': int(os.environ.get('FETCH_WORKERS', '8')),
+
     # Weather API
     'met_api_url': 'https://frost.met.no/observations/v0.jsonld',
     'met_client_id': os.environ.get('MET_CLIENT_ID', ''),  # Optional: register at frost.met.no
@@ -109,8 +114,15 @@ SHIP_TYPES = {
 }
 
 
+# AIS ship type codes are 0-99: index a tuple of every name (including the
+# 'Type N' fallbacks) instead of hashing into SHIP_TYPES
+SHIP_TYPE_NAMES = tuple(SHIP_TYPES.get(code, f'Type {code}') for code in range(100))
+
+
 def get_ship_type_name(ship_type):
     """Convert ship type code to human-readable name"""
     if ship_type is None:
         return 'Unknown'
+    if type(ship_type) is int and 0 <= ship_type < 100:
+        return SHIP_TYPE_NAMES[ship_type]
     return SHIP_TYPES.get(ship_type, f'Type {ship_type}')
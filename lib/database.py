@@ -4,7 +4,12 @@ Supports both SQLite (local development) and PostgreSQL (production)
 """
 
 import os
+import io
+import csv
 import logging
+from functools import lru_cache
+from lib.geo_utils import waiting_zone_bbox
+from lib.waiting import zone_classifier
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +19,7 @@ USE_POSTGRES = os.environ.get('RENDER') is not None or os.environ.get('DATABASE_
 # Always import both to avoid runtime errors
 try:
     import psycopg2
+    import psycopg2.extras
 except ImportError:
     psycopg2 = None
 
@@ -23,47 +29,47 @@ except ImportError:
     sqlite3 = None
 
 
-class Database:
-    """Database abstraction layer supporting both SQLite and PostgreSQL"""
-
-    def __init__(self, config, use_postgres=USE_POSTGRES):
-        """
-        Initialize database connection
-
-        Args:
-            config: Configuration dict with 'sqlite_db' and 'postgres_url' keys
-            use_postgres: If True, use PostgreSQL; otherwise SQLite
-        """
-        self.config = config
-        self.use_postgres = use_postgres
-        self.conn = None
-        self.cursor = None
-
-    def connect(self):
-        """Establish database connection"""
-        if self.use_postgres:
-            logger.info("Connecting to PostgreSQL...")
-            self.conn = psycopg2.connect(self.config['postgres_url'])
-            self.cursor = self.conn.cursor()
-        else:
-            logger.info(f"Connecting to SQLite: {self.config['sqlite_db']}")
-            self.conn = sqlite3.connect(self.config['sqlite_db'])
-            self.cursor = self.conn.cursor()
+@lru_cache(maxsize=256)
+def _to_sqlite_paramstyle(query):
+    """Convert %s placeholders to SQLite's ? (cached, queries are mostly constants)"""
+    return query.replace('%s', '?')
 
-    def create_tables(self):
-        """Create database tables if they don't exist"""
-        if self.use_postgres:
-            self._create_postgres_tables()
-        else:
-            self._create_sqlite_tables()
 
-        self.conn.commit()
+# Column types that differ between the two databases, filled into the
+# schema templates below
+COLUMN_TYPES = {
+    'postgres': {
+        'id': 'SERIAL PRIMARY KEY',
+        'mmsi': 'BIGINT',
+        'timestamp': 'TIMESTAMP WITH TIME ZONE',
+        'fetched_at': 'TIMESTAMP',
+        'date': 'DATE',
+        'bool': 'BOOLEAN',
+        'unique_position': ',\n                UNIQUE (mmsi, timestamp)',
+        'unique_crossing': ',\n                UNIQUE (mmsi, crossing_time)',
+        'position_include': ' INCLUDE (latitude, longitude, sog)',
+        'position_index': 'INDEX IF NOT EXISTS idx_positions_mmsi_ts',
+    },
+    'sqlite': {
+        'id': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+        'mmsi': 'INTEGER',
+        'timestamp': 'TEXT',
+        'fetched_at': 'TEXT',
+        'date': 'TEXT',
+        'bool': 'INTEGER',
+        'unique_position': '',
+        'unique_crossing': '',
+        'position_include': '',
+        # SQLite can't add the UNIQUE constraint to an existing table, so the
+        # (mmsi, timestamp) index enforces it instead
+        'position_index': 'UNIQUE INDEX IF NOT EXISTS idx_positions_mmsi_ts_unique',
+    },
+}
 
-    def _create_postgres_tables(self):
-        """Create PostgreSQL tables"""
-        self.cursor.execute('''
+TABLES = [
+    '''
             CREATE TABLE IF NOT EXISTS ships (
-                mmsi BIGINT PRIMARY KEY,
+                mmsi {mmsi} PRIMARY KEY,
                 name TEXT,
                 ship_type INTEGER,
                 ship_type_name TEXT,
@@ -71,42 +77,39 @@ class Database:
                 callsign TEXT,
                 length REAL,
                 width REAL,
-                ship_info_fetched_at TIMESTAMP
+                ship_info_fetched_at {fetched_at}
             )
-        ''')
-
-        self.cursor.execute('''
+    ''',
+    '''
             CREATE TABLE IF NOT EXISTS positions (
-                id SERIAL PRIMARY KEY,
-                mmsi BIGINT,
-                timestamp TIMESTAMP WITH TIME ZONE,
+                id {id},
+                mmsi {mmsi},
+                timestamp {timestamp},
                 latitude REAL,
                 longitude REAL,
                 sog REAL,
                 cog REAL,
                 heading INTEGER,
-                FOREIGN KEY (mmsi) REFERENCES ships(mmsi),
-                UNIQUE (mmsi, timestamp)
+                in_east {bool},
+                in_west {bool},
+                FOREIGN KEY (mmsi) REFERENCES ships(mmsi){unique_position}
             )
-        ''')
-
-        self.cursor.execute('''
+    ''',
+    '''
             CREATE TABLE IF NOT EXISTS crossings (
-                id SERIAL PRIMARY KEY,
-                mmsi BIGINT,
-                crossing_time TIMESTAMP WITH TIME ZONE,
+                id {id},
+                mmsi {mmsi},
+                crossing_time {timestamp},
                 crossing_lat REAL,
                 crossing_lon REAL,
                 direction TEXT,
-                FOREIGN KEY (mmsi) REFERENCES ships(mmsi),
-                UNIQUE (mmsi, crossing_time)
+                FOREIGN KEY (mmsi) REFERENCES ships(mmsi){unique_crossing}
             )
-        ''')
-
-        self.cursor.execute('''
+    ''',
+    '''
             CREATE TABLE IF NOT EXISTS weather (
-                id SERIAL PRIMARY KEY,
-                timestamp TIMESTAMP WITH TIME ZONE,
+                id {id},
+                timestamp {timestamp},
                 station TEXT,
                 wind_speed REAL,
                 wind_direction REAL,
@@ -115,26 +118,24 @@ class Database:
                 air_temperature REAL,
                 pressure REAL
             )
-        ''')
-
-        self.cursor.execute('''
+    ''',
+    '''
             CREATE TABLE IF NOT EXISTS waiting_events (
-                id SERIAL PRIMARY KEY,
-                mmsi BIGINT,
+                id {id},
+                mmsi {mmsi},
                 zone TEXT,
-                start_time TIMESTAMP WITH TIME ZONE,
-                end_time TIMESTAMP WITH TIME ZONE,
+                start_time {timestamp},
+                end_time {timestamp},
                 duration_minutes INTEGER,
                 avg_speed REAL,
-                crossed BOOLEAN,
-                crossing_time TIMESTAMP WITH TIME ZONE,
+                crossed {bool},
+                crossing_time {timestamp},
                 FOREIGN KEY (mmsi) REFERENCES ships(mmsi)
             )
-        ''')
-
-        self.cursor.execute('''
+    ''',
+    '''
             CREATE TABLE IF NOT EXISTS daily_stats (
-                date DATE PRIMARY KEY,
+                date {date} PRIMARY KEY,
                 total_crossings INTEGER,
                 avg_wind_speed REAL,
                 max_wind_gust REAL,
@@ -142,114 +143,250 @@ class Database:
                 waiting_events INTEGER,
                 avg_waiting_time REAL
             )
-        ''')
-
-        # Create indexes for performance
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_positions_mmsi ON positions(mmsi)')
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_positions_timestamp ON positions(timestamp)')
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_crossings_mmsi ON crossings(mmsi)')
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_weather_timestamp ON weather(timestamp)')
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_waiting_mmsi ON waiting_events(mmsi)')
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_waiting_start ON waiting_events(start_time)')
-
-    def _create_sqlite_tables(self):
-        """Create SQLite tables"""
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ships (
-                mmsi INTEGER PRIMARY KEY,
-                name TEXT,
-                ship_type INTEGER,
-                ship_type_name TEXT,
-                destination TEXT,
-                callsign TEXT,
-                length REAL,
-                width REAL,
-                ship_info_fetched_at TEXT
-            )
-        ''')
-
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS positions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                mmsi INTEGER,
-                timestamp TEXT,
+    ''',
+    # Newest stored position per ship, kept up to date by store_track so the
+    # web app's active ships list doesn't search the positions table
+    '''
+            CREATE TABLE IF NOT EXISTS latest_positions (
+                mmsi {mmsi} PRIMARY KEY,
+                timestamp {timestamp},
                 latitude REAL,
                 longitude REAL,
                 sog REAL,
                 cog REAL,
-                heading INTEGER,
-                FOREIGN KEY (mmsi) REFERENCES ships(mmsi)
+                heading INTEGER
             )
-        ''')
-
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS crossings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                mmsi INTEGER,
-                crossing_time TEXT,
-                crossing_lat REAL,
-                crossing_lon REAL,
-                direction TEXT,
-                FOREIGN KEY (mmsi) REFERENCES ships(mmsi)
+    ''',
+    # Waiting detection progress per ship, so each run only scans new positions
+    '''
+            CREATE TABLE IF NOT EXISTS scan_state (
+                mmsi {mmsi} PRIMARY KEY,
+                last_timestamp {timestamp},
+                open_waiting_start {timestamp},
+                last_position_id INTEGER
             )
-        ''')
+    ''',
+]
 
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS weather (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT,
-                station TEXT,
-                wind_speed REAL,
-                wind_direction REAL,
-                wind_gust REAL,
-                wave_height REAL,
-                air_temperature REAL,
-                pressure REAL
-            )
-        ''')
+INDEXES = [
+    # Single-column mmsi indexes are covered by the composite indexes below
+    'DROP INDEX IF EXISTS idx_positions_mmsi',
+    'DROP INDEX IF EXISTS idx_crossings_mmsi',
+    'DROP INDEX IF EXISTS idx_waiting_mmsi',
+    'CREATE INDEX IF NOT EXISTS idx_positions_timestamp ON positions(timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_weather_timestamp ON weather(timestamp)',
+    # One observation per station and time, so re-fetched weather is skipped
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_weather_station_time ON weather(station, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_waiting_start ON waiting_events(start_time)',
+    # Newest crossings first in the web app's crossing list and 24-hour count
+    'CREATE INDEX IF NOT EXISTS idx_crossings_time ON crossings(crossing_time)',
+    'CREATE INDEX IF NOT EXISTS idx_latest_positions_timestamp ON latest_positions(timestamp)',
+    # Composite (covering on PostgreSQL) indexes for the per-ship ordered
+    # scans in waiting detection
+    'CREATE {position_index} ON positions(mmsi, timestamp){position_include}',
+    'CREATE INDEX IF NOT EXISTS idx_positions_zone ON positions(mmsi, timestamp) WHERE in_east OR in_west',
+    'CREATE INDEX IF NOT EXISTS idx_crossings_mmsi_time ON crossings(mmsi, crossing_time)',
+    'CREATE INDEX IF NOT EXISTS idx_waiting_mmsi_start ON waiting_events(mmsi, start_time)',
+]
 
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS waiting_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                mmsi INTEGER,
-                zone TEXT,
-                start_time TEXT,
-                end_time TEXT,
-                duration_minutes INTEGER,
-                avg_speed REAL,
-                crossed INTEGER,
-                crossing_time TEXT,
-                FOREIGN KEY (mmsi) REFERENCES ships(mmsi)
-            )
+
+class Database:
+    """
+    Database abstraction layer supporting both SQLite and PostgreSQL
+
+    Queries can be written once with %s placeholders; on SQLite they are
+    converted to ? before running. Queries already using ? are left unchanged.
+    """
+
+    def __init__(self, config, use_postgres=USE_POSTGRES):
+        """
+        Initialize database connection
+
+        Args:
+            config: Configuration dict with 'sqlite_db' and 'postgres_url' keys
+            use_postgres: If True, use PostgreSQL; otherwise SQLite
+        """
+        self.config = config
+        self.use_postgres = use_postgres
+        self.conn = None
+        self.cursor = None
+
+    def connect(self):
+        """Establish database connection"""
+        if self.use_postgres:
+            logger.info("Connecting to PostgreSQL...")
+            self.conn = psycopg2.connect(self.config['postgres_url'])
+            self.cursor = self.conn.cursor()
+        else:
+            logger.info(f"Connecting to SQLite: {self.config['sqlite_db']}")
+            self.conn = sqlite3.connect(self.config['sqlite_db'])
+            # WAL lets the web app read while the collector writes, and with
+            # synchronous=NORMAL a commit no longer fsyncs a rollback journal
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('PRAGMA temp_store=MEMORY')
+            self.conn.execute('PRAGMA cache_size=-65536')  # 64 MB
+            self.conn.execute('PRAGMA mmap_size=268435456')  # 256 MB
+            self.cursor = self.conn.cursor()
+
+    def create_tables(self):
+        """Create database tables if they don't exist"""
+        types = COLUMN_TYPES['postgres' if self.use_postgres else 'sqlite']
+
+        for statement in TABLES:
+            self.cursor.execute(statement.format(**types))
+
+        self._migrate_zone_flags(types['bool'])
+        self._backfill_latest_positions()
+        self._remove_duplicates('weather', 'station, timestamp', 'idx_weather_station_time')
+        if not self.use_postgres:
+            # Replaced by the unique index, so re-fetched positions are ignored
+            self._remove_duplicates('positions', 'mmsi, timestamp', 'idx_positions_mmsi_ts_unique')
+            self.cursor.execute('DROP INDEX IF EXISTS idx_positions_mmsi_ts')
+
+        for statement in INDEXES:
+            self.cursor.execute(statement.format(**types))
+
+        self.conn.commit()
+
+    def _migrate_zone_flags(self, column_type):
+        """Add the waiting zone flags to positions tables created before they existed"""
+        # NULL means not yet classified
+        if self.use_postgres:
+            self.cursor.execute("SELECT column_name FROM information_schema.columns "
+                                "WHERE table_name = 'positions' AND table_schema = current_schema()")
+            position_columns = {row[0] for row in self.cursor.fetchall()}
+        else:
+            self.cursor.execute('PRAGMA table_info(positions)')
+            position_columns = {row[1] for row in self.cursor.fetchall()}
+
+        missing = [column for column in ('in_east', 'in_west') if column not in position_columns]
+        if not missing:
+            return
+
+        if not self.use_postgres and not self.conn.in_transaction:
+            # Make the added columns and their backfill one transaction, as on
+            # PostgreSQL, so an interrupted migration is redone on the next start
+            self.cursor.execute('BEGIN')
+        for column in missing:
+            self.cursor.execute(f'ALTER TABLE positions ADD COLUMN {column} {column_type}')
+        if 'waiting_zone_east' in self.config:
+            self._backfill_zone_flags(batch_size=10000)
+
+    def _backfill_zone_flags(self, batch_size):
+        """Set the waiting zone flags on positions stored before they were recorded"""
+        zones = (self.config['waiting_zone_east'], self.config['waiting_zone_west'])
+
+        # Nearly all positions are outside both zones' bounding boxes; those are
+        # settled in one statement, and only the rest are classified one by one
+        outside = ' AND '.join(['NOT (latitude BETWEEN %s AND %s AND longitude BETWEEN %s AND %s)'] * len(zones))
+        bbox_params = [value for zone in zones for value in waiting_zone_bbox(zone)]
+        self.execute(f'UPDATE positions SET in_east = %s, in_west = %s WHERE {outside}',
+                     (False, False, *bbox_params))
+
+        classify = zone_classifier(*zones)
+        last_id = 0
+        while True:
+            self.execute('''
+                SELECT id, latitude, longitude
+                FROM positions
+                WHERE in_east IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL AND id > %s
+                ORDER BY id
+                LIMIT %s
+            ''', (last_id, batch_size))
+            rows = self.cursor.fetchall()
+            if not rows:
+                break
+            self.executemany('UPDATE positions SET in_east = %s, in_west = %s WHERE id = %s',
+                             [(*classify(lat, lon), position_id) for position_id, lat, lon in rows])
+            last_id = rows[-1][0]
+
+    def _remove_duplicates(self, table, columns, index):
+        """
+        Keep only the first of rows with equal columns, before the unique index
+        on them is created
+
+        Tables from before the index existed can hold duplicates, which would
+        make creating it fail. Once it exists, nothing is done.
+
+        Args:
+            table: Table name
+            columns: Comma-separated columns of the unique index
+            index: Name of the unique index
+        """
+        if self.use_postgres:
+            self.cursor.execute('SELECT to_regclass(%s)', (index,))
+            if self.cursor.fetchone()[0] is not None:
+                return
+        else:
+            self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index,))
+            if self.cursor.fetchone() is not None:
+                return
+
+        self.cursor.execute(f'''
+            DELETE FROM {table}
+            WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {columns})
         ''')
+        if self.cursor.rowcount > 0:
+            logger.info(f"Removed {self.cursor.rowcount} duplicate rows from {table}")
 
+    def _backfill_latest_positions(self):
+        """Fill latest_positions from positions stored before the table existed"""
+        self.cursor.execute('SELECT 1 FROM latest_positions LIMIT 1')
+        if self.cursor.fetchone() is not None:
+            return
         self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS daily_stats (
-                date TEXT PRIMARY KEY,
-                total_crossings INTEGER,
-                avg_wind_speed REAL,
-                max_wind_gust REAL,
-                avg_wave_height REAL,
-                waiting_events INTEGER,
-                avg_waiting_time REAL
-            )
+            INSERT INTO latest_positions (mmsi, timestamp, latitude, longitude, sog, cog, heading)
+            SELECT mmsi, timestamp, latitude, longitude, sog, cog, heading
+            FROM (
+                SELECT
+                    mmsi, timestamp, latitude, longitude, sog, cog, heading,
+                    ROW_NUMBER() OVER (PARTITION BY mmsi ORDER BY timestamp DESC) as rn
+                FROM positions
+            ) ranked_positions
+            WHERE rn = 1
         ''')
 
-        # Create indexes
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_positions_mmsi ON positions(mmsi)')
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_positions_timestamp ON positions(timestamp)')
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_crossings_mmsi ON crossings(mmsi)')
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_weather_timestamp ON weather(timestamp)')
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_waiting_mmsi ON waiting_events(mmsi)')
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_waiting_start ON waiting_events(start_time)')
+    def _adapt(self, query):
+        """Return query with placeholders in this database's paramstyle"""
+        if self.use_postgres:
+            return query
+        return _to_sqlite_paramstyle(query)
 
     def execute(self, query, params=None):
         """Execute a query"""
+        query = self._adapt(query)
         if params:
             self.cursor.execute(query, params)
         else:
             self.cursor.execute(query)
 
+    def executemany(self, query, params_seq, page_size=1000):
+        """
+        Execute a query for each parameter tuple in a batch
+
+        On PostgreSQL rows are sent in pages of page_size statements per
+        round-trip; on SQLite the statement is prepared once and reused.
+        """
+        if self.use_postgres:
+            psycopg2.extras.execute_batch(self.cursor, query, params_seq, page_size=page_size)
+        else:
+            self.cursor.executemany(self._adapt(query), params_seq)
+
+    def copy_rows(self, table, columns, rows):
+        """
+        Bulk-load rows into a table with COPY (PostgreSQL only)
+
+        Args:
+            table: Table name
+            columns: Column names, in the order of the values in each row
+            rows: Iterable of tuples; None is loaded as NULL
+        """
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator='\n').writerows(rows)
+        buf.seek(0)
+        self.cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
     def fetchone(self):
         """Fetch one result"""
         return self.cursor.fetchone()
@@ -258,6 +395,37 @@ class Database:
         """Fetch all results"""
         return self.cursor.fetchall()
 
+    def iterate(self, query, params=None, batch_size=10000):
+        """
+        Stream query results without loading them all into memory
+
+        Uses a server-side (named) cursor on PostgreSQL and fetchmany on SQLite.
+        The query runs on its own cursor, so the shared cursor stays usable.
+        Consume the generator fully before committing.
+
+        Yields:
+            tuple: One result row at a time
+        """
+        if self.use_postgres:
+            cursor = self.conn.cursor(name='stream')
+        else:
+            cursor = self.conn.cursor()
+            query = self._adapt(query)
+
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
     def commit(self):
         """Commit transaction"""
         self.conn.commit()
@@ -0,0 +1,28 @@
+"""
+Loading of local .env files
+"""
+
+import os
+from pathlib import Path
+
+
+def load_env(path):
+    """
+    Load KEY=value lines from a .env file into os.environ
+
+    Variables already set in the environment win. Blank lines and lines
+    starting with # are skipped. A missing file is ignored, and on Render
+    (where the environment is configured in the dashboard) nothing is read.
+
+    Args:
+        path: Path of the .env file
+    """
+    path = Path(path)
+    if os.environ.get('RENDER') or not path.exists():
+        return
+
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if line and not line.startswith('#') and '=' in line:
+            key, _, value = line.partition('=')
+            os.environ.setdefault(key, value)
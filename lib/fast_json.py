@@ -0,0 +1,27 @@
+"""
+JSON decoding for API responses, using orjson when it is installed
+"""
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def response_json(response):
+    """
+    Decode the JSON body of an HTTP response
+
+    orjson parses the raw bytes several times faster than the stdlib json
+    behind response.json(), which matters for long tracks. Without orjson
+    this is just response.json().
+
+    Args:
+        response: requests.Response
+
+    Returns:
+        Decoded JSON value
+    """
+    if orjson is None:
+        return response.json()
+    return orjson.loads(response.content)
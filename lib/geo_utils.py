@@ -2,7 +2,8 @@
 Geographical utility functions for Stadthavet AIS tracking
 """
 
-from math import radians, sin, cos, sqrt, atan2
+from functools import lru_cache
+from math import radians, degrees, sin, cos, asin, sqrt, atan2, hypot
 
 
 def ccw(A, B, C):
@@ -10,6 +11,29 @@ def ccw(A, B, C):
     return (C[1] - A[1]) * (B[0] - A[0]) > (B[1] - A[1]) * (C[0] - A[0])
 
 
+def line_side(line_start, line_end):
+    """
+    Build a fast side-of-line test for a fixed line
+
+    The line's coordinates are folded into constants, so each call is two
+    multiplications and a comparison.
+
+    Args:
+        line_start, line_end: Endpoints of the line (tuples of (x, y))
+
+    Returns:
+        function: side(point) -> bool, same as ccw(point, line_start, line_end)
+    """
+    cx, cy = line_start
+    dx = line_end[0] - cx
+    dy = line_end[1] - cy
+
+    def side(point):
+        return dx * (point[1] - cy) > dy * (point[0] - cx)
+
+    return side
+
+
 def line_segments_intersect(A, B, C, D):
     """
     Check if line segment AB intersects with CD
@@ -21,6 +45,10 @@ def line_segments_intersect(A, B, C, D):
     Returns:
         bool: True if segments intersect, False otherwise
     """
+    # Segments whose bounding boxes don't overlap can't intersect
+    if (max(A[0], B[0]) < min(C[0], D[0]) or min(A[0], B[0]) > max(C[0], D[0])
+            or max(A[1], B[1]) < min(C[1], D[1]) or min(A[1], B[1]) > max(C[1], D[1])):
+        return False
     return ccw(A, C, D) != ccw(B, C, D) and ccw(A, B, C) != ccw(A, B, D)
 
 
@@ -58,38 +86,178 @@ def is_in_waiting_zone(lat, lon, zone_config):
     Returns:
         bool: True if within zone, False otherwise
     """
-    distance = haversine_distance(
-        lat, lon,
-        zone_config['center_lat'],
-        zone_config['center_lon']
-    )
-    return distance <= zone_config['radius_km']
+    center_lat = zone_config['center_lat']
+    center_lon = zone_config['center_lon']
+    radius_km = zone_config['radius_km']
 
+    # Most positions are far from the zone; reject them without trigonometry
+    min_lat, max_lat, min_lon, max_lon = _bbox(center_lat, center_lon, radius_km)
+    if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+        return False
 
-def distance_to_stad_line(lat, lon, stad_line_start, stad_line_end):
+    distance = haversine_distance(lat, lon, center_lat, center_lon)
+    return distance <= radius_km
+
+
+def waiting_zone_bbox(zone_config):
     """
-    Calculate minimum distance from a point to the Stad crossing line.
+    Calculate the bounding box of a waiting zone
+
+    Every point within radius_km of the zone center lies inside the box, so
+    positions outside it can be rejected without computing a distance.
+
+    Args:
+        zone_config: Dict with 'center_lat', 'center_lon', 'radius_km'
+
+    Returns:
+        tuple: (min_lat, max_lat, min_lon, max_lon) in decimal degrees
+    """
+    return _bbox(zone_config['center_lat'], zone_config['center_lon'], zone_config['radius_km'])
+
+
+@lru_cache(maxsize=32)
+def _bbox(lat0, lon0, radius_km):
+    """Bounding box of a circle, cached since there are only a couple of zones"""
+    R = 6371  # Earth's radius in kilometers
+
+    angle = radius_km / R
+
+    # Small margin so points exactly on the circle are not lost to rounding
+    dlat = degrees(angle) + 1e-9
+    dlon = degrees(asin(min(1.0, sin(angle) / cos(radians(lat0))))) + 1e-9
+
+    return lat0 - dlat, lat0 + dlat, lon0 - dlon, lon0 + dlon
+
+
+def waiting_zone_checker(zone_config):
+    """
+    Build a fast membership test for a waiting zone
+
+    Positions outside the bounding box are rejected with comparisons only.
+    Inside it, a flat (equirectangular) distance decides all positions that are
+    clearly inside or outside the circle; only those within 2% of the radius
+    fall back to the exact haversine distance, so results always match
+    is_in_waiting_zone.
+
+    Args:
+        zone_config: Dict with 'center_lat', 'center_lon', 'radius_km'
+
+    Returns:
+        function: check(lat, lon) -> bool
+    """
+    R = 6371  # Earth's radius in kilometers
+
+    min_lat, max_lat, min_lon, max_lon = waiting_zone_bbox(zone_config)
+    lat0 = zone_config['center_lat']
+    lon0 = zone_config['center_lon']
+    cos_lat0 = cos(radians(lat0))
+    radius_deg = degrees(zone_config['radius_km'] / R)
+    inner2 = (radius_deg * 0.98) ** 2
+    outer2 = (radius_deg * 1.02) ** 2
+
+    def check(lat, lon):
+        if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+            return False
+        dlat = lat - lat0
+        dlon = (lon - lon0) * cos_lat0
+        d2 = dlat * dlat + dlon * dlon
+        if d2 <= inner2:
+            return True
+        if d2 > outer2:
+            return False
+        return is_in_waiting_zone(lat, lon, zone_config)
+
+    return check
+
+
+def stad_line_distance(stad_line_start, stad_line_end):
+    """
+    Build a fast distance-to-line function for a fixed Stad line
+
+    Positions are projected onto a flat (equirectangular) plane around the
+    line's midpoint, and the distance to the nearest point of the segment is
+    measured there. Within 100 km of Stad this is within 1% of the
+    great-circle distance, and needs no trigonometry per call.
 
     Args:
-        lat, lon: Point coordinates (decimal degrees)
         stad_line_start: Tuple of (lon, lat) for line start
         stad_line_end: Tuple of (lon, lat) for line end
 
     Returns:
-        float: Distance in kilometers (approximate)
+        function: distance(lat, lon) -> kilometers
     """
-    # Get endpoints of Stad line
+    R = 6371  # Earth's radius in kilometers
+
     lon1, lat1 = stad_line_start
     lon2, lat2 = stad_line_end
-
-    # Calculate distance to both endpoints
-    dist_to_start = haversine_distance(lat, lon, lat1, lon1)
-    dist_to_end = haversine_distance(lat, lon, lat2, lon2)
-
-    # Calculate distance to midpoint (approximate distance to line)
     mid_lat = (lat1 + lat2) / 2
     mid_lon = (lon1 + lon2) / 2
-    dist_to_mid = haversine_distance(lat, lon, mid_lat, mid_lon)
 
-    # Return minimum distance to line (simplified - uses closest of start/mid/end)
-    return min(dist_to_start, dist_to_mid, dist_to_end)
+    # Kilometers per degree of latitude and of longitude at the midpoint
+    ky = radians(R)
+    kx = ky * cos(radians(mid_lat))
+
+    x1 = (lon1 - mid_lon) * kx
+    y1 = (lat1 - mid_lat) * ky
+    dx = (lon2 - lon1) * kx
+    dy = (lat2 - lat1) * ky
+    length2 = dx * dx + dy * dy
+
+    def distance(lat, lon):
+        px = (lon - mid_lon) * kx - x1
+        py = (lat - mid_lat) * ky - y1
+        # Position of the closest point along the segment, 0 = start, 1 = end
+        t = (px * dx + py * dy) / length2 if length2 else 0.0
+        if t < 0.0:
+            t = 0.0
+        elif t > 1.0:
+            t = 1.0
+        return hypot(px - t * dx, py - t * dy)
+
+    return distance
+
+
+@lru_cache(maxsize=32)
+def stad_line_bbox(stad_line_start, stad_line_end, margin_km):
+    """
+    Calculate the bounding box of all points within margin_km of the Stad line
+
+    Uses the same flat projection as stad_line_distance: every point it
+    measures within margin_km lies inside the box, so positions outside the
+    box need no distance calculation.
+
+    Args:
+        stad_line_start: Tuple of (lon, lat) for line start
+        stad_line_end: Tuple of (lon, lat) for line end
+        margin_km: Distance from the line in kilometers
+
+    Returns:
+        tuple: (min_lat, max_lat, min_lon, max_lon) in decimal degrees
+    """
+    R = 6371  # Earth's radius in kilometers
+
+    lon1, lat1 = stad_line_start
+    lon2, lat2 = stad_line_end
+
+    # Small margin so points exactly at margin_km are not lost to rounding
+    dlat = degrees(margin_km / R) + 1e-9
+    dlon = degrees(margin_km / R) / cos(radians((lat1 + lat2) / 2)) + 1e-9
+
+    return min(lat1, lat2) - dlat, max(lat1, lat2) + dlat, min(lon1, lon2) - dlon, max(lon1, lon2) + dlon
+
+
+def distance_to_stad_line(lat, lon, stad_line_start, stad_line_end):
+    """
+    Calculate minimum distance from a point to the Stad crossing line.
+
+    For many points, build the function once with stad_line_distance().
+
+    Args:
+        lat, lon: Point coordinates (decimal degrees)
+        stad_line_start: Tuple of (lon, lat) for line start
+        stad_line_end: Tuple of (lon, lat) for line end
+
+    Returns:
+        float: Distance in kilometers (approximate)
+    """
+    return stad_line_distance(stad_line_start, stad_line_end)(lat, lon)
@@ -0,0 +1,55 @@
+"""
+Rate limiting for external APIs
+"""
+
+import time
+from threading import Lock
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter
+
+    Holds up to capacity tokens, refilled at refill_per_sec. Each request takes
+    one token, so short bursts go through right away and only sustained traffic
+    is slowed down to the refill rate.
+    """
+
+    def __init__(self, capacity, refill_per_sec):
+        """
+        Args:
+            capacity: Maximum number of tokens (largest burst)
+            refill_per_sec: Tokens added per second (sustained rate)
+        """
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens from the bucket, sleeping until enough are available
+
+        The lock is held while sleeping, so waiting callers are served in turn.
+
+        Args:
+            tokens: Number of tokens to take
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.refill_per_sec)
+            self.last = now
+
+            wait = 0.0
+            if self.tokens < tokens:
+                wait = (tokens - self.tokens) / self.refill_per_sec
+                time.sleep(wait)
+                self.tokens = tokens
+                self.last = time.monotonic()
+
+            self.tokens -= tokens
+            return wait
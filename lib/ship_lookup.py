@@ -4,23 +4,49 @@ Ship lookup integration using Marinesia API for vessel static data
 
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from threading import Lock
+from lib.fast_json import response_json
+from lib.rate_limit import TokenBucket
 
 logger = logging.getLogger(__name__)
 
-# Global rate limiting: 10 requests per minute = 1 request per 6 seconds
-_last_request_time = 0
-_request_lock = Lock()
+# Shared HTTP session: keeps the TLS connection to Marinesia alive between
+# lookups instead of reconnecting for every ship. Transient server errors are
+# retried with backoff; 429s are handled in _fetch_ship_info, so that every
+# retry also goes through the rate limit.
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    max_retries=Retry(total=3, backoff_factor=2, status_forcelist=(502, 503, 504),
+                      raise_on_status=False)
+))
+RATE_LIMIT_RETRIES = 2  # Retries of a lookup Marinesia answered with 429
+RETRY_AFTER_DEFAULT = 60  # Seconds to wait after a 429 without a usable Retry-After
+
+# Global rate limiting. Marinesia documents 10 requests/minute but seems
+# stricter in practice, so lookups are kept to one per 10 seconds on average.
+# A burst of 4 still keeps any 60-second window within the documented 10.
+_BUCKET = TokenBucket(capacity=4, refill_per_sec=1 / 10)
+
+# Lookups done in this process: mmsi -> (expires_at, ship info or None).
+# Failed lookups are kept for a shorter time so they are retried sooner.
+_CACHE = {}
+_CACHE_LOCK = Lock()
+CACHE_TTL = 24 * 3600
+CACHE_TTL_MISSING = 3600
 
 
 def get_ship_info(mmsi, config):
     """
     Fetch ship static data (length, width, etc.) from Marinesia API
 
-    Rate limit: 10 requests/minute per Marinesia docs
-    This function includes retry logic with exponential backoff for 429 errors
+    Rate limit: 10 requests/minute per Marinesia docs, enforced by a shared token bucket
+    Results (including failures) are cached in this process, so repeated
+    lookups of the same ship don't wait for the rate limit again.
 
     Args:
         mmsi: Ship MMSI number
@@ -36,27 +62,41 @@ def get_ship_info(mmsi, config):
         logger.warning("MARINESIA_KEY not set in environment, skipping ship lookup")
         return None
 
+    with _CACHE_LOCK:
+        cached = _CACHE.get(mmsi)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+
+    ship_info = _fetch_ship_info(mmsi, api_key)
+
+    ttl = CACHE_TTL if ship_info is not None else CACHE_TTL_MISSING
+    with _CACHE_LOCK:
+        _CACHE[mmsi] = (time.monotonic() + ttl, ship_info)
+    return ship_info
+
+
+def _fetch_ship_info(mmsi, api_key):
+    """Look up one ship in the Marinesia API, waiting for the rate limit"""
     url = f'https://api.marinesia.com/api/v1/vessel/{mmsi}/profile'
     params = {'key': api_key}
 
-    # Enforce rate limit: Being conservative with 10s between requests
-    # (Marinesia docs say 10 req/min, but seems stricter in practice)
-    global _last_request_time
-    with _request_lock:
-        now = time.time()
-        time_since_last = now - _last_request_time
-        if time_since_last < 10.0:  # Conservative: 10 seconds = ~6 req/min
-            sleep_time = 10.0 - time_since_last
-            logger.debug(f"Rate limiting: sleeping {sleep_time:.1f}s before MMSI {mmsi}")
-            time.sleep(sleep_time)
-        _last_request_time = time.time()
-
-    # Single request with rate limiting already enforced above
     try:
-        response = requests.get(url, params=params, timeout=10)
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            # Enforce rate limit
+            waited = _BUCKET.acquire()
+            if waited:
+                logger.debug(f"Rate limiting: slept {waited:.1f}s before MMSI {mmsi}")
+
+            response = SESSION.get(url, params=params, timeout=10)
+            if response.status_code != 429 or attempt == RATE_LIMIT_RETRIES:
+                break
+
+            delay = _retry_after(response)
+            logger.info(f"Rate limit hit for MMSI {mmsi}, retrying in {delay:.0f}s")
+            time.sleep(delay)
 
         if response.status_code == 200:
-            result = response.json()
+            result = response_json(response)
 
             if result.get('error') is False and result.get('data'):
                 data = result['data']
@@ -85,8 +125,7 @@ def get_ship_info(mmsi, config):
             return None
 
         elif response.status_code == 429:
-            # Rate limit exceeded - this shouldn't happen with our rate limiting, but log it
-            logger.warning(f"Rate limit hit for MMSI {mmsi} despite rate limiting (skipping)")
+            logger.warning(f"Rate limit hit for MMSI {mmsi} despite retries (skipping)")
             return None
 
         else:
@@ -99,3 +138,33 @@ def get_ship_info(mmsi, config):
     except Exception as e:
         logger.error(f"Error fetching ship info for MMSI {mmsi}: {e}")
         return None
+
+
+def _retry_after(response):
+    """Seconds to wait before retrying a 429 response, from its Retry-After header"""
+    try:
+        return max(0.0, float(response.headers['Retry-After']))
+    except (KeyError, ValueError):
+        # Missing, or an HTTP date instead of seconds
+        return RETRY_AFTER_DEFAULT
+
+
+def get_ship_info_batch(mmsis, config, max_workers=4):
+    """
+    Fetch ship static data for several MMSIs concurrently
+
+    Lookups share the rate limit and session with get_ship_info, so the rate
+    limit rather than each request's latency sets the pace.
+
+    Args:
+        mmsis: Iterable of ship MMSI numbers
+        config: Configuration dict, passed on to get_ship_info
+        max_workers: Number of lookups in flight at once (at most the
+                     session's connection pool size, 10 by default)
+
+    Returns:
+        dict: mmsi -> ship info dict, or None if the lookup failed
+    """
+    mmsis = list(mmsis)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(zip(mmsis, pool.map(lambda mmsi: get_ship_info(mmsi, config), mmsis)))
@@ -0,0 +1,158 @@
+"""
+Waiting (loitering) detection for ships near the Stad peninsula
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from lib.geo_utils import waiting_zone_checker
+
+
+def to_epoch(value):
+    """
+    Convert a database timestamp to seconds since the epoch
+
+    Args:
+        value: ISO 8601 string (SQLite) or datetime (PostgreSQL). Values without
+               timezone information are taken to be UTC.
+
+    Returns:
+        float: Seconds since 1970-01-01T00:00:00Z
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def zone_classifier(zone_east, zone_west):
+    """
+    Build a function that tells which waiting zones a position is in
+
+    Args:
+        zone_east, zone_west: Dicts with 'center_lat', 'center_lon', 'radius_km'
+
+    Returns:
+        function: classify(lat, lon) -> (in_east, in_west) booleans
+    """
+    in_east = waiting_zone_checker(zone_east)
+    in_west = waiting_zone_checker(zone_west)
+
+    def classify(lat, lon):
+        return in_east(lat, lon), in_west(lat, lon)
+
+    return classify
+
+
+def find_waiting_periods(positions, zone_east, zone_west, speed_threshold, track_ends=None):
+    """
+    Find periods where ships stayed slow inside a single waiting zone
+
+    Args:
+        positions: Iterable of (mmsi, timestamp, latitude, longitude, sog, in_east, in_west)
+                   tuples, ordered by mmsi and then timestamp. in_east/in_west are the
+                   stored zone flags; None means not classified yet and the zones are
+                   checked here.
+        zone_east, zone_west: Dicts with 'center_lat', 'center_lon', 'radius_km'
+        speed_threshold: Speed (knots) below which a ship is considered waiting
+        track_ends: Optional dict, filled with mmsi -> (last_timestamp, open_waiting_start)
+                    as each ship's track is finished. open_waiting_start is None unless
+                    the ship was still waiting at its last position.
+
+    Yields:
+        tuple: (mmsi, zone, start_time, end_time, speeds) for each finished waiting
+               period. end_time is the timestamp of the first position after the ship
+               left the zone or sped up, and speeds holds the known speeds while waiting.
+               Periods still open at the end of a ship's track are not yielded.
+    """
+    classify = zone_classifier(zone_east, zone_west)
+
+    current_mmsi = None
+    waiting_start = None
+    waiting_zone = None
+    speeds_in_zone = []
+    last_timestamp = None
+
+    for mmsi, timestamp, lat, lon, sog, in_east, in_west in positions:
+        if mmsi != current_mmsi:
+            if track_ends is not None and current_mmsi is not None:
+                track_ends[current_mmsi] = (last_timestamp, waiting_start)
+
+            # New ship: any unfinished waiting period of the previous ship is dropped
+            current_mmsi = mmsi
+            waiting_start = None
+            waiting_zone = None
+            speeds_in_zone = []
+
+        last_timestamp = timestamp
+
+        # Check speed threshold first (if available) - it is much cheaper than the
+        # zone distance checks, and most positions are ships under way
+        zone = None
+        if sog is None or sog < speed_threshold:
+            # Check if in waiting zone
+            if in_east is None or in_west is None:
+                in_east, in_west = classify(lat, lon)
+            if in_east:
+                zone = 'east'
+            elif in_west:
+                zone = 'west'
+
+        if zone is not None:
+            if waiting_start is not None and zone == waiting_zone:
+                # Continuing to wait in same zone
+                if sog is not None:
+                    speeds_in_zone.append(sog)
+            else:
+                # Start of waiting period (or changed zones, reset)
+                waiting_start = timestamp
+                waiting_zone = zone
+                speeds_in_zone = [sog] if sog is not None else []
+
+        elif waiting_start is not None:
+            # Ship left waiting zone or sped up
+            yield mmsi, waiting_zone, waiting_start, timestamp, speeds_in_zone
+
+            # Reset waiting tracking
+            waiting_start = None
+            waiting_zone = None
+            speeds_in_zone = []
+
+    if track_ends is not None and current_mmsi is not None:
+        track_ends[current_mmsi] = (last_timestamp, waiting_start)
+
+
+def max_in_window(timestamps, values, start, end):
+    """
+    Find the maximum value observed in a time window
+
+    Args:
+        timestamps: Sorted list of observation timestamps
+        values: List of values, parallel to timestamps
+        start, end: Window bounds (inclusive, same type as timestamps)
+
+    Returns:
+        Maximum value with start <= timestamp <= end, or None if there is none
+    """
+    lo = bisect_left(timestamps, start)
+    hi = bisect_right(timestamps, end)
+    if lo >= hi:
+        return None
+    return max(values[lo:hi])
+
+
+def next_index_after(timestamps, value):
+    """
+    Find the first timestamp strictly after a value
+
+    Args:
+        timestamps: Sorted list of timestamps
+        value: Value to search from (same type as timestamps)
+
+    Returns:
+        Index of the first timestamp > value, or None if there is none
+    """
+    i = bisect_right(timestamps, value)
+    if i < len(timestamps):
+        return i
+    return None
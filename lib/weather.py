@@ -4,9 +4,29 @@ Weather data integration from met.no Frost API
 
 import logging
 import requests
+from lib.fast_json import response_json
 
 logger = logging.getLogger(__name__)
 
+# Frost API element IDs we request, and the observation keys they are stored under
+ELEMENT_MAP = {
+    'wind_speed': 'wind_speed',
+    'wind_from_direction': 'wind_direction',
+    'max_wind_speed_of_gust(PT1H)': 'wind_gust',
+    'air_temperature': 'air_temperature',
+    'air_pressure_at_sea_level': 'pressure',
+}
+
+INSERT_WEATHER_PG = '''
+    INSERT INTO weather (timestamp, station, wind_speed, wind_direction, wind_gust, air_temperature, pressure)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT DO NOTHING
+'''
+INSERT_WEATHER_SQLITE = '''
+    INSERT OR IGNORE INTO weather (timestamp, station, wind_speed, wind_direction, wind_gust, air_temperature, pressure)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
 
 def fetch_weather_data(start_time, end_time, config):
     """
@@ -23,7 +43,7 @@ def fetch_weather_data(start_time, end_time, config):
     # Frost API requires ISO format timestamps
     params = {
         'sources': config['weather_station'],
-        'elements': 'wind_speed,wind_from_direction,max_wind_speed_of_gust(PT1H),air_temperature,air_pressure_at_sea_level',
+        'elements': ','.join(ELEMENT_MAP),
         'referencetime': f"{start_time}/{end_time}"
     }
 
@@ -36,7 +56,7 @@ def fetch_weather_data(start_time, end_time, config):
         response = requests.get(config['met_api_url'], params=params, auth=auth, timeout=30)
 
         if response.status_code == 200:
-            return response.json()
+            return response_json(response)
         else:
             logger.warning(f"Weather API error: {response.status_code}")
             if response.status_code == 401:
@@ -67,19 +87,9 @@ def parse_weather_observations(weather_data, station_id):
         elements = {}
 
         for elem in obs.get('observations', []):
-            elem_id = elem.get('elementId')
-            value = elem.get('value')
-
-            if elem_id == 'wind_speed':
-                elements['wind_speed'] = value
-            elif elem_id == 'wind_from_direction':
-                elements['wind_direction'] = value
-            elif elem_id == 'max_wind_speed_of_gust(PT1H)':
-                elements['wind_gust'] = value
-            elif elem_id == 'air_temperature':
-                elements['air_temperature'] = value
-            elif elem_id == 'air_pressure_at_sea_level':
-                elements['pressure'] = value
+            key = ELEMENT_MAP.get(elem.get('elementId'))
+            if key:
+                elements[key] = elem.get('value')
 
         if timestamp and elements:
             observations.append({
@@ -114,27 +124,16 @@ def store_weather_data(db, start_time, end_time, config):
     observations = parse_weather_observations(weather_data, config['weather_station'])
     logger.info(f"✓ Got {len(observations)} weather observations")
 
-    # Store in database
-    stored = 0
-    for obs in observations:
-        if db.use_postgres:
-            db.execute('''
-                INSERT INTO weather (timestamp, station, wind_speed, wind_direction, wind_gust, air_temperature, pressure)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT DO NOTHING
-            ''', (obs['timestamp'], obs['station'],
-                  obs.get('wind_speed'), obs.get('wind_direction'),
-                  obs.get('wind_gust'), obs.get('air_temperature'),
-                  obs.get('pressure')))
-        else:
-            db.execute('''
-                INSERT OR IGNORE INTO weather (timestamp, station, wind_speed, wind_direction, wind_gust, air_temperature, pressure)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (obs['timestamp'], obs['station'],
-                  obs.get('wind_speed'), obs.get('wind_direction'),
-                  obs.get('wind_gust'), obs.get('air_temperature'),
-                  obs.get('pressure')))
-        stored += 1
+    # Store in database, in one batch
+    rows = [
+        (obs['timestamp'], obs['station'],
+         obs.get('wind_speed'), obs.get('wind_direction'),
+         obs.get('wind_gust'), obs.get('air_temperature'),
+         obs.get('pressure'))
+        for obs in observations
+    ]
+    db.executemany(INSERT_WEATHER_PG if db.use_postgres else INSERT_WEATHER_SQLITE, rows)
+    stored = len(rows)
 
     db.commit()
     logger.info(f"✓ Stored {stored} weather observations")
@@ -4,6 +4,7 @@ Generate favicon and PWA icons for Stadthavet AIS
 Design: Ship entering a tunnel (representing ships going through Stad ship tunnel)
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageDraw
 
 def create_ship_tunnel_icon(size):
@@ -68,38 +69,46 @@ def create_ship_tunnel_icon(size):
 
     return img
 
-# Generate favicon.ico (16x16, 32x32, 48x48)
-print("Generating favicon.ico...")
-icon16 = create_ship_tunnel_icon(16)
-icon32 = create_ship_tunnel_icon(32)
-icon48 = create_ship_tunnel_icon(48)
-icon16.save('static/favicon.ico', format='ICO', sizes=[(16, 16), (32, 32), (48, 48)])
-
-# Generate PNG versions for various uses
-print("Generating favicon-16x16.png...")
-icon16.save('static/favicon-16x16.png', format='PNG')
-
-print("Generating favicon-32x32.png...")
-icon32.save('static/favicon-32x32.png', format='PNG')
-
-print("Generating apple-touch-icon.png (180x180)...")
-icon180 = create_ship_tunnel_icon(180)
-icon180.save('static/apple-touch-icon.png', format='PNG')
-
-# Generate PWA icons
-print("Generating android-chrome-192x192.png...")
-icon192 = create_ship_tunnel_icon(192)
-icon192.save('static/android-chrome-192x192.png', format='PNG')
-
-print("Generating android-chrome-512x512.png...")
-icon512 = create_ship_tunnel_icon(512)
-icon512.save('static/android-chrome-512x512.png', format='PNG')
-
-print("\nAll icons generated successfully!")
-print("\nGenerated files:")
-print("  - static/favicon.ico (16x16, 32x32, 48x48)")
-print("  - static/favicon-16x16.png")
-print("  - static/favicon-32x32.png")
-print("  - static/apple-touch-icon.png (180x180)")
-print("  - static/android-chrome-192x192.png (for PWA)")
-print("  - static/android-chrome-512x512.png (for PWA)")
+# PNG icons: (size, file name)
+PNG_ICONS = [
+    (16, 'favicon-16x16.png'),
+    (32, 'favicon-32x32.png'),
+    (180, 'apple-touch-icon.png'),
+    (192, 'android-chrome-192x192.png'),  # PWA
+    (512, 'android-chrome-512x512.png'),  # PWA
+]
+
+
+def main():
+    # Draw once at the largest size and scale down for the others, which is
+    # cheaper than redrawing and keeps lines smooth at small sizes
+    master = create_ship_tunnel_icon(512)
+
+    def save_png(icon):
+        size, name = icon
+        img = master if size == master.width else master.resize((size, size), Image.Resampling.LANCZOS)
+        img.save(f'static/{name}', format='PNG')
+        print(f"Generated {name}")
+
+    # Generate favicon.ico (16x16, 32x32, 48x48). The ICO writer only includes
+    # sizes up to the saved image's own, so save from the 48x48 version
+    print("Generating favicon.ico...")
+    master.resize((48, 48), Image.Resampling.LANCZOS).save(
+        'static/favicon.ico', format='ICO', sizes=[(16, 16), (32, 32), (48, 48)])
+
+    # PNG encoding (zlib) releases the GIL, so the files are written in parallel
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(save_png, PNG_ICONS))
+
+    print("\nAll icons generated successfully!")
+    print("\nGenerated files:")
+    print("  - static/favicon.ico (16x16, 32x32, 48x48)")
+    print("  - static/favicon-16x16.png")
+    print("  - static/favicon-32x32.png")
+    print("  - static/apple-touch-icon.png (180x180)")
+    print("  - static/android-chrome-192x192.png (for PWA)")
+    print("  - static/android-chrome-512x512.png (for PWA)")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,21 +4,19 @@
 import requests
 import os
 from pathlib import Path
+from lib.env import load_env
 from datetime import datetime, timedelta
 
 # Load .env
-env_path = Path(__file__).parent / '.env'
-if env_path.exists():
-    with open(env_path) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                os.environ.setdefault(key, value)
+load_env(Path(__file__).parent / '.env')
 
 client_id = os.environ.get('MET_CLIENT_ID', '')
 auth = (client_id, '') if client_id else None
 
+# One session for all stations, so the connection to Frost is reused
+session = requests.Session()
+session.auth = auth
+
 # Test three stations
 stations = [
     ('SN59800', 'Svinøy Fyr'),
@@ -26,6 +24,9 @@ stations = [
     ('SN59110', 'Kråkenes'),
 ]
 
+# Elements we need (substrings of Frost element IDs)
+IMPORTANT = ['wind_speed', 'max(wind_speed_of_gust', 'sea_surface_wave_height', 'air_temperature']
+
 end_time = datetime.utcnow()
 start_time = end_time - timedelta(hours=24)
 
@@ -39,8 +40,8 @@ for station_id, station_name in stations:
         'referencetime': f"{start_time.strftime('%Y-%m-%d')}/{end_time.strftime('%Y-%m-%d')}",
     }
 
-    response = requests.get('https://frost.met.no/observations/availableTimeSeries/v0.jsonld',
-                           params=params, auth=auth)
+    response = session.get('https://frost.met.no/observations/availableTimeSeries/v0.jsonld',
+                           params=params)
 
     if response.status_code == 200:
         data = response.json()
@@ -49,15 +50,18 @@ for station_id, station_name in stations:
             elem_id = series.get('elementId', 'Unknown')
             elements.add(elem_id)
 
+        # Check specifically for what we want, sorting the elements into
+        # buckets in the same pass that prints them
+        found_by_name = {imp: [] for imp in IMPORTANT}
         print(f"\nTilgjengelege element ({len(elements)}):")
         for elem in sorted(elements):
             print(f"  ✓ {elem}")
+            for imp, found in found_by_name.items():
+                if imp in elem:
+                    found.append(elem)
 
-        # Check specifically for what we want
-        important = ['wind_speed', 'max(wind_speed_of_gust', 'sea_surface_wave_height', 'air_temperature']
         print(f"\nViktige element:")
-        for imp in important:
-            found = [e for e in elements if imp in e]
+        for imp, found in found_by_name.items():
             if found:
                 print(f"  ✓ {', '.join(found)}")
             else:
@@ -4,16 +4,10 @@
 import requests
 import os
 from pathlib import Path
+from lib.env import load_env
 
 # Load .env
-env_path = Path(__file__).parent / '.env'
-if env_path.exists():
-    with open(env_path) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                os.environ.setdefault(key, value)
+load_env(Path(__file__).parent / '.env')
 
 client_id = os.environ.get('MET_CLIENT_ID', '')
 
@@ -0,0 +1,223 @@
+"""
+Tests for waiting event detection in the collector
+"""
+
+import pytest
+from concurrent.futures import Future
+from barents import detect_waiting_events, map_ahead
+from lib.database import Database
+
+
+EAST = (62.25, 5.3)
+OPEN_SEA = (62.6, 4.8)
+
+
+def make_db():
+    """Empty in-memory SQLite database with the schema"""
+    db = Database({'sqlite_db': ':memory:'}, use_postgres=False)
+    db.connect()
+    db.create_tables()
+    return db
+
+
+@pytest.fixture
+def db():
+    """Empty database for one test"""
+    db = make_db()
+    yield db
+    db.close()
+
+
+def add_wait(db, mmsi, day, hour=10):
+    """Store a track of a ship waiting 4 hours in the east zone and then leaving"""
+    db.execute('INSERT OR IGNORE INTO ships (mmsi, name) VALUES (%s, %s)', (mmsi, f'SHIP {mmsi}'))
+    db.executemany('''
+        INSERT OR IGNORE INTO positions (mmsi, timestamp, latitude, longitude, sog, in_east, in_west)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ''', [
+        (mmsi, f'2024-10-{day:02d}T{hour:02d}:00:00Z', *EAST, 1.0, True, False),
+        (mmsi, f'2024-10-{day:02d}T{hour + 2:02d}:00:00Z', *EAST, 1.0, True, False),
+        (mmsi, f'2024-10-{day:02d}T{hour + 4:02d}:00:00Z', *OPEN_SEA, 12.0, False, False),
+    ])
+    db.commit()
+
+
+def add_weather(db, timestamp, wind_speed=15.0):
+    """Store a wind observation"""
+    db.execute('INSERT INTO weather (timestamp, station, wind_speed) VALUES (%s, %s, %s)',
+               (timestamp, 'SN59800', wind_speed))
+    db.commit()
+
+
+def waiting_events(db):
+    """Stored waiting events as (mmsi, start_time, end_time, crossed, crossing_time)"""
+    db.execute('''
+        SELECT mmsi, start_time, end_time, crossed, crossing_time
+        FROM waiting_events
+        ORDER BY mmsi, start_time
+    ''')
+    return db.fetchall()
+
+
+class TestDetectWaitingEvents:
+    """Tests for detect_waiting_events"""
+
+    def test_bad_timestamps_are_skipped(self, db):
+        """Test that a weather or crossing row with a bad timestamp doesn't stop detection"""
+        add_wait(db, 111111111, 24)
+        add_weather(db, '2024-10-24T11:00:00Z')
+        add_weather(db, 'not a time')
+        db.execute('''
+            INSERT INTO crossings (mmsi, crossing_time, direction) VALUES
+                (111111111, 'not a time', 'E->W'),
+                (111111111, '2024-10-24T15:00:00Z', 'E->W')
+        ''')
+        db.commit()
+
+        assert detect_waiting_events(db) == 1
+        assert waiting_events(db) == [
+            (111111111, '2024-10-24T10:00:00Z', '2024-10-24T14:00:00Z', 1, '2024-10-24T15:00:00Z'),
+        ]
+
+    def test_first_run_rebuilds_events(self, db):
+        """Test that the first run replaces waiting events stored before scan state existed"""
+        add_wait(db, 111111111, 24)
+        add_weather(db, '2024-10-24T11:00:00Z')
+        db.execute('''
+            INSERT INTO waiting_events (mmsi, zone, start_time, end_time, crossed)
+            VALUES (999999999, 'east', '2024-01-01T00:00:00Z', '2024-01-01T05:00:00Z', 0)
+        ''')
+        db.commit()
+
+        detect_waiting_events(db)
+
+        assert waiting_events(db) == [
+            (111111111, '2024-10-24T10:00:00Z', '2024-10-24T14:00:00Z', 0, None),
+        ]
+
+    def test_incremental_runs_match_full_scan(self, db):
+        """Test that runs on new positions give the same events as one run on all of them"""
+        add_wait(db, 111111111, 24)
+        add_weather(db, '2024-10-24T11:00:00Z')
+        detect_waiting_events(db)
+
+        add_wait(db, 111111111, 25)
+        add_wait(db, 222222222, 25, hour=12)
+        add_weather(db, '2024-10-25T13:00:00Z')
+        assert detect_waiting_events(db) == 2
+
+        full = make_db()
+        add_wait(full, 111111111, 24)
+        add_wait(full, 111111111, 25)
+        add_wait(full, 222222222, 25, hour=12)
+        add_weather(full, '2024-10-24T11:00:00Z')
+        add_weather(full, '2024-10-25T13:00:00Z')
+        detect_waiting_events(full)
+
+        assert len(waiting_events(db)) == 3
+        assert waiting_events(db) == waiting_events(full)
+        full.close()
+
+    def test_backfilled_positions_rescan_ship(self, db):
+        """Test that positions older than the scanned ones are picked up without duplicates"""
+        add_wait(db, 111111111, 25)
+        add_weather(db, '2024-10-24T11:00:00Z')
+        add_weather(db, '2024-10-25T11:00:00Z')
+        detect_waiting_events(db)
+
+        add_wait(db, 111111111, 24)
+        detect_waiting_events(db)
+
+        assert waiting_events(db) == [
+            (111111111, '2024-10-24T10:00:00Z', '2024-10-24T14:00:00Z', 0, None),
+            (111111111, '2024-10-25T10:00:00Z', '2024-10-25T14:00:00Z', 0, None),
+        ]
+
+    def test_refetched_positions_ignored(self, db):
+        """Test that storing an already scanned track again doesn't rescan the ship"""
+        add_wait(db, 111111111, 24)
+        add_weather(db, '2024-10-24T11:00:00Z')
+        detect_waiting_events(db)
+
+        add_wait(db, 111111111, 24)
+        assert detect_waiting_events(db) == 0
+
+        db.execute('SELECT COUNT(*) FROM positions')
+        assert db.fetchone() == (3,)
+        assert len(waiting_events(db)) == 1
+
+    def test_period_waits_for_weather(self, db):
+        """Test that a period is judged once its weather has been fetched"""
+        add_wait(db, 111111111, 24)
+        add_wait(db, 111111111, 25)
+        add_weather(db, '2024-10-24T11:00:00Z')
+
+        # Weather reaches into the first period only
+        assert detect_waiting_events(db) == 1
+
+        add_weather(db, '2024-10-25T11:00:00Z')
+        assert detect_waiting_events(db) == 1
+
+        assert waiting_events(db) == [
+            (111111111, '2024-10-24T10:00:00Z', '2024-10-24T14:00:00Z', 0, None),
+            (111111111, '2024-10-25T10:00:00Z', '2024-10-25T14:00:00Z', 0, None),
+        ]
+
+    def test_weather_gap_drops_period(self, db):
+        """Test that a period without weather, while later weather exists, is not kept pending"""
+        add_wait(db, 111111111, 24)
+        add_weather(db, '2024-10-23T11:00:00Z')
+        add_weather(db, '2024-10-25T11:00:00Z')
+
+        assert detect_waiting_events(db) == 0
+
+        db.execute('SELECT open_waiting_start FROM scan_state WHERE mmsi = %s', (111111111,))
+        assert db.fetchone() == (None,)
+
+    def test_later_crossing_marks_event(self, db):
+        """Test that stored events are marked crossed when the ship crosses in a later run"""
+        add_wait(db, 111111111, 24)
+        add_weather(db, '2024-10-24T11:00:00Z')
+        detect_waiting_events(db)
+
+        db.execute('''
+            INSERT INTO crossings (mmsi, crossing_time, direction)
+            VALUES (111111111, '2024-10-24T18:00:00Z', 'E->W')
+        ''')
+        db.commit()
+        detect_waiting_events(db)
+
+        assert waiting_events(db) == [
+            (111111111, '2024-10-24T10:00:00Z', '2024-10-24T14:00:00Z', 1, '2024-10-24T18:00:00Z'),
+        ]
+
+
+class FakePool:
+    """Executor that runs calls right away and counts them"""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, item):
+        self.submitted += 1
+        future = Future()
+        future.set_result(fn(item))
+        return future
+
+
+class TestMapAhead:
+    """Tests for map_ahead"""
+
+    def test_results_in_order(self):
+        """Test that results come back in the order of the items"""
+        pool = FakePool()
+        assert list(map_ahead(pool, lambda x: x * 10, range(5), 2)) == [(0, 0), (1, 10), (2, 20), (3, 30), (4, 40)]
+
+    def test_submits_only_ahead(self):
+        """Test that no more than ahead calls are submitted beyond the consumed results"""
+        pool = FakePool()
+        consumed = 0
+        for _ in map_ahead(pool, lambda x: x, range(100), 4):
+            consumed += 1
+            assert pool.submitted - consumed <= 4
+        assert pool.submitted == 100
@@ -0,0 +1,120 @@
+"""
+Tests for Barentswatch API helpers
+"""
+
+import os
+import pytest
+from unittest.mock import Mock, patch
+from lib import barentswatch_api
+from lib.barentswatch_api import fetch_track, get_access_token, _TOKENS
+
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    """Start every test without tokens cached in the process"""
+    _TOKENS.clear()
+    yield
+    _TOKENS.clear()
+
+
+@pytest.fixture
+def token_config(tmp_path):
+    """Config with a token cache file in a temporary directory"""
+    return {
+        'client_id': 'test_client',
+        'client_secret': 'secret',
+        'auth_url': 'https://test.auth/token',
+        'token_cache_file': str(tmp_path / 'token.json')
+    }
+
+
+def token_response(token, expires_in=3600):
+    """Build a mocked successful token response"""
+    response = Mock()
+    response.status_code = 200
+    response.json.return_value = {'access_token': token, 'expires_in': expires_in}
+    return response
+
+
+class TestAccessTokenCache:
+    """Tests for reusing access tokens between runs"""
+
+    def test_token_reused(self, token_config):
+        """Test that a cached token is reused instead of authenticating again"""
+        with patch('lib.barentswatch_api.SESSION.post') as mock_post:
+            mock_post.return_value = token_response('first')
+            assert get_access_token(token_config) == 'first'
+            assert get_access_token(token_config) == 'first'
+            assert mock_post.call_count == 1
+
+        assert os.stat(token_config['token_cache_file']).st_mode & 0o777 == 0o600
+
+    def test_expiring_token_refreshed(self, token_config):
+        """Test that a token about to expire is not reused"""
+        with patch('lib.barentswatch_api.SESSION.post') as mock_post:
+            mock_post.return_value = token_response('short', expires_in=30)
+            get_access_token(token_config)
+            mock_post.return_value = token_response('second')
+            assert get_access_token(token_config) == 'second'
+            assert mock_post.call_count == 2
+
+    def test_other_client_not_reused(self, token_config):
+        """Test that a token cached for other credentials is ignored"""
+        with patch('lib.barentswatch_api.SESSION.post') as mock_post:
+            mock_post.return_value = token_response('first')
+            get_access_token(token_config)
+            token_config['client_id'] = 'other_client'
+            mock_post.return_value = token_response('other')
+            assert get_access_token(token_config) == 'other'
+
+    def test_token_reused_without_cache_file(self, token_config):
+        """Test that a token is reused within the process even without a cache file"""
+        del token_config['token_cache_file']
+        with patch('lib.barentswatch_api.SESSION.post') as mock_post:
+            mock_post.return_value = token_response('first')
+            assert get_access_token(token_config) == 'first'
+            assert get_access_token(token_config) == 'first'
+            assert mock_post.call_count == 1
+
+    def test_cache_file_read_once(self, token_config):
+        """Test that a token from the cache file is kept in the process"""
+        with patch('lib.barentswatch_api.SESSION.post') as mock_post:
+            mock_post.return_value = token_response('first')
+            get_access_token(token_config)
+        _TOKENS.clear()
+
+        read = barentswatch_api._read_cached_token
+        with patch.object(barentswatch_api, '_read_cached_token', wraps=read) as mock_read:
+            assert get_access_token(token_config) == 'first'
+            assert get_access_token(token_config) == 'first'
+            assert mock_read.call_count == 1
+
+    def test_rejected_token_replaced(self, token_config):
+        """Test that a token the API refused is not handed out again"""
+        with patch('lib.barentswatch_api.SESSION.post') as mock_post:
+            mock_post.return_value = token_response('first')
+            get_access_token(token_config)
+            mock_post.return_value = token_response('second')
+            assert get_access_token(token_config, rejected='first') == 'second'
+            # Another worker with the same stale token gets the new one without authenticating
+            assert get_access_token(token_config, rejected='first') == 'second'
+            assert mock_post.call_count == 2
+
+
+class TestFetchTrack:
+    """Tests for fetching tracks"""
+
+    def test_expired_token_renewed(self, token_config):
+        """Test that a 401 gets a new token and the request is retried once"""
+        token_config['track_url'] = 'https://test.api/track'
+        expired = Mock(status_code=401)
+        ok = Mock(status_code=200, content=b'[{"mmsi": 1}]')
+
+        with patch('lib.barentswatch_api.SESSION.post') as mock_post, \
+                patch('lib.barentswatch_api.SESSION.get') as mock_get:
+            mock_post.return_value = token_response('new')
+            mock_get.side_effect = [expired, ok]
+
+            assert fetch_track('old', 1, 'from', 'to', token_config) == [{'mmsi': 1}]
+
+        assert mock_get.call_args.kwargs['headers']['Authorization'] == 'Bearer new'
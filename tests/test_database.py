@@ -26,6 +26,30 @@ def sqlite_config():
         os.unlink(db_path)
 
 
+@pytest.fixture(scope='module')
+def shared_db(tmp_path_factory):
+    """SQLite database with the schema created once for the whole module"""
+    config = {
+        'sqlite_db': str(tmp_path_factory.mktemp('db') / 'shared.db'),
+        'postgres_url': None
+    }
+    db = Database(config, use_postgres=False)
+    db.connect()
+    db.execute('PRAGMA synchronous=OFF')  # Throwaway file, no need to fsync
+    db.create_tables()
+
+    yield db
+
+    db.close()
+
+
+@pytest.fixture
+def db(shared_db):
+    """The shared database; tests don't commit, and their rows are rolled back afterwards"""
+    yield shared_db
+    shared_db.conn.rollback()
+
+
 class TestDatabase:
     """Tests for Database class"""
 
@@ -37,6 +61,16 @@ class TestDatabase:
         assert db.cursor is not None
         db.close()
 
+    def test_sqlite_wal_mode(self, sqlite_config):
+        """Test that SQLite connections use write-ahead logging"""
+        db = Database(sqlite_config, use_postgres=False)
+        db.connect()
+
+        db.execute('PRAGMA journal_mode')
+        assert db.fetchone()[0] == 'wal'
+
+        db.close()
+
     def test_create_tables(self, sqlite_config):
         """Test creating all tables"""
         db = Database(sqlite_config, use_postgres=False)
@@ -77,18 +111,13 @@ class TestDatabase:
 
         db.close()
 
-    def test_insert_ship(self, sqlite_config):
+    def test_insert_ship(self, db):
         """Test inserting a ship record"""
-        db = Database(sqlite_config, use_postgres=False)
-        db.connect()
-        db.create_tables()
-
         # Insert a ship
         db.execute('''
             INSERT INTO ships (mmsi, name, ship_type, ship_type_name, destination, callsign, length, width)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (123456789, 'Test Ship', 70, 'Cargo', 'Bergen', 'TEST1', 150.0, 25.0))
-        db.commit()
 
         # Verify inserted
         db.execute('SELECT * FROM ships WHERE mmsi = ?', (123456789,))
@@ -99,14 +128,8 @@ class TestDatabase:
         assert ship[1] == 'Test Ship'  # name
         assert ship[4] == 'Bergen'  # destination
 
-        db.close()
-
-    def test_insert_position(self, sqlite_config):
+    def test_insert_position(self, db):
         """Test inserting a position record"""
-        db = Database(sqlite_config, use_postgres=False)
-        db.connect()
-        db.create_tables()
-
         # Insert ship first
         db.execute('''
             INSERT INTO ships (mmsi, name, ship_type, ship_type_name)
@@ -118,7 +141,6 @@ class TestDatabase:
             INSERT INTO positions (mmsi, timestamp, latitude, longitude, sog, cog, heading)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         ''', (123456789, '2025-10-23T10:00:00Z', 62.3, 5.1, 12.5, 180, 175))
-        db.commit()
 
         # Verify
         db.execute('SELECT * FROM positions WHERE mmsi = ?', (123456789,))
@@ -129,14 +151,8 @@ class TestDatabase:
         assert pos[3] == 62.3  # latitude
         assert pos[4] == 5.1  # longitude
 
-        db.close()
-
-    def test_insert_crossing(self, sqlite_config):
+    def test_insert_crossing(self, db):
         """Test inserting a crossing record"""
-        db = Database(sqlite_config, use_postgres=False)
-        db.connect()
-        db.create_tables()
-
         # Insert ship first
         db.execute('''
             INSERT INTO ships (mmsi, name, ship_type, ship_type_name)
@@ -148,7 +164,6 @@ class TestDatabase:
             INSERT INTO crossings (mmsi, crossing_time, crossing_lat, crossing_lon, direction)
             VALUES (?, ?, ?, ?, ?)
         ''', (123456789, '2025-10-23T10:00:00Z', 62.3, 4.7, 'Westbound'))
-        db.commit()
 
         # Verify
         db.execute('SELECT * FROM crossings WHERE mmsi = ?', (123456789,))
@@ -158,21 +173,143 @@ class TestDatabase:
         assert crossing[1] == 123456789  # mmsi
         assert crossing[5] == 'Westbound'  # direction
 
-        db.close()
-
-    def test_indexes_created(self, sqlite_config):
+    def test_indexes_created(self, db):
         """Test that indexes are created"""
-        db = Database(sqlite_config, use_postgres=False)
-        db.connect()
-        db.create_tables()
-
         # Check that indexes exist
         db.execute("SELECT name FROM sqlite_master WHERE type='index'")
         indexes = [row[0] for row in db.fetchall()]
 
-        assert 'idx_positions_mmsi' in indexes
         assert 'idx_positions_timestamp' in indexes
-        assert 'idx_crossings_mmsi' in indexes
         assert 'idx_weather_timestamp' in indexes
+        assert 'idx_weather_station_time' in indexes
+        assert 'idx_positions_mmsi_ts_unique' in indexes
+        assert 'idx_crossings_mmsi_time' in indexes
+        assert 'idx_crossings_time' in indexes
+        assert 'idx_waiting_mmsi_start' in indexes
+
+        # Redundant with the composite indexes
+        assert 'idx_positions_mmsi' not in indexes
+        assert 'idx_crossings_mmsi' not in indexes
+        assert 'idx_waiting_mmsi' not in indexes
+
+    def test_iterate_streams_rows(self, db):
+        """Test streaming query results in batches"""
+        db.executemany('''
+            INSERT INTO positions (mmsi, timestamp, latitude, longitude)
+            VALUES (?, ?, ?, ?)
+        ''', [(123456789, f'2025-10-23T10:{i:02d}:00Z', 62.3, 5.1) for i in range(25)])
+
+        rows = list(db.iterate('SELECT timestamp FROM positions ORDER BY timestamp', batch_size=10))
+
+        assert len(rows) == 25
+        assert rows[0][0] == '2025-10-23T10:00:00Z'
+        assert rows[-1][0] == '2025-10-23T10:24:00Z'
+
+    def test_postgres_placeholders_on_sqlite(self, db):
+        """Test that %s placeholders work on SQLite"""
+        db.execute('INSERT INTO ships (mmsi, name) VALUES (%s, %s)', (123456789, 'Test Ship'))
+
+        db.execute('SELECT name FROM ships WHERE mmsi = %s', (123456789,))
+        assert db.fetchone()[0] == 'Test Ship'
+
+    def test_latest_positions_backfilled(self, sqlite_config):
+        """Test that latest_positions is filled from existing positions"""
+        db = Database(sqlite_config, use_postgres=False)
+        db.connect()
+        db.create_tables()
+
+        db.executemany('''
+            INSERT INTO positions (mmsi, timestamp, latitude, longitude)
+            VALUES (?, ?, ?, ?)
+        ''', [
+            (111111111, '2025-10-23T10:00:00Z', 62.1, 5.1),
+            (111111111, '2025-10-23T11:00:00Z', 62.2, 5.2),
+            (222222222, '2025-10-23T09:00:00Z', 62.3, 5.3),
+        ])
+        db.commit()
+
+        db.create_tables()
+
+        db.execute('SELECT mmsi, timestamp, latitude FROM latest_positions ORDER BY mmsi')
+        assert db.fetchall() == [
+            (111111111, '2025-10-23T11:00:00Z', 62.2),
+            (222222222, '2025-10-23T09:00:00Z', 62.3),
+        ]
+
+        db.close()
+
+    def test_zone_flags_migrated(self, sqlite_config):
+        """Test that positions stored before the zone flags existed are classified once"""
+        sqlite_config['waiting_zone_east'] = {'center_lat': 62.25, 'center_lon': 5.3, 'radius_km': 10}
+        sqlite_config['waiting_zone_west'] = {'center_lat': 62.25, 'center_lon': 4.2, 'radius_km': 10}
+        db = Database(sqlite_config, use_postgres=False)
+        db.connect()
+        db.execute('''
+            CREATE TABLE positions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, mmsi INTEGER, timestamp TEXT,
+                latitude REAL, longitude REAL, sog REAL, cog REAL, heading INTEGER
+            )
+        ''')
+        db.executemany('''
+            INSERT INTO positions (mmsi, timestamp, latitude, longitude)
+            VALUES (?, ?, ?, ?)
+        ''', [
+            (111111111, '2025-10-23T10:00:00Z', 62.25, 5.3),
+            (111111111, '2025-10-23T11:00:00Z', 62.25, 4.2),
+            (111111111, '2025-10-23T12:00:00Z', 62.6, 4.8),
+        ])
+        db.commit()
+
+        db.create_tables()
+
+        db.execute('SELECT in_east, in_west FROM positions ORDER BY id')
+        assert db.fetchall() == [(1, 0), (0, 1), (0, 0)]
+
+        db.close()
+
+    def test_weather_duplicates_removed(self, sqlite_config):
+        """Test that duplicate observations are removed and no longer stored"""
+        db = Database(sqlite_config, use_postgres=False)
+        db.connect()
+        db.execute('CREATE TABLE weather (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, station TEXT, wind_speed REAL)')
+        db.executemany('INSERT INTO weather (timestamp, station, wind_speed) VALUES (?, ?, ?)', [
+            ('2025-10-23T10:00:00Z', 'SN59800', 10.0),
+            ('2025-10-23T10:00:00Z', 'SN59800', 10.0),
+            ('2025-10-23T11:00:00Z', 'SN59800', 12.0),
+        ])
+        db.commit()
+
+        db.create_tables()
+        db.execute("INSERT OR IGNORE INTO weather (timestamp, station, wind_speed) VALUES ('2025-10-23T11:00:00Z', 'SN59800', 12.0)")
+
+        db.execute('SELECT id, timestamp FROM weather ORDER BY id')
+        assert db.fetchall() == [(1, '2025-10-23T10:00:00Z'), (3, '2025-10-23T11:00:00Z')]
+
+        db.close()
+
+    def test_position_duplicates_removed(self, sqlite_config):
+        """Test that duplicate positions are removed and re-fetched ones are ignored"""
+        db = Database(sqlite_config, use_postgres=False)
+        db.connect()
+        db.execute('''
+            CREATE TABLE positions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, mmsi INTEGER, timestamp TEXT,
+                latitude REAL, longitude REAL, sog REAL, cog REAL, heading INTEGER
+            )
+        ''')
+        db.execute('CREATE INDEX idx_positions_mmsi_ts ON positions(mmsi, timestamp)')
+        position = (111111111, '2025-10-23T10:00:00Z', 62.1, 5.1)
+        db.executemany('INSERT INTO positions (mmsi, timestamp, latitude, longitude) VALUES (?, ?, ?, ?)',
+                       [position, position])
+        db.commit()
+
+        db.create_tables()
+        db.execute('INSERT OR IGNORE INTO positions (mmsi, timestamp, latitude, longitude) VALUES (?, ?, ?, ?)',
+                   position)
+
+        db.execute('SELECT id FROM positions')
+        assert db.fetchall() == [(1,)]
+        db.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name = 'idx_positions_mmsi_ts'")
+        assert db.fetchone() is None
 
         db.close()
@@ -0,0 +1,47 @@
+"""
+Tests for .env loading
+"""
+
+import os
+from lib.env import load_env
+
+
+def test_loads_variables(tmp_path, monkeypatch):
+    """Test that KEY=value lines are loaded, skipping comments and blank lines"""
+    env_file = tmp_path / '.env'
+    env_file.write_text('# comment\n\nSTADTHAVET_TEST_A=one\nSTADTHAVET_TEST_B=a=b\n')
+    monkeypatch.delenv('STADTHAVET_TEST_A', raising=False)
+    monkeypatch.delenv('STADTHAVET_TEST_B', raising=False)
+
+    load_env(env_file)
+
+    assert os.environ['STADTHAVET_TEST_A'] == 'one'
+    assert os.environ['STADTHAVET_TEST_B'] == 'a=b'
+
+
+def test_environment_wins(tmp_path, monkeypatch):
+    """Test that variables already set are not overwritten"""
+    env_file = tmp_path / '.env'
+    env_file.write_text('STADTHAVET_TEST_A=from_file\n')
+    monkeypatch.setenv('STADTHAVET_TEST_A', 'from_env')
+
+    load_env(env_file)
+
+    assert os.environ['STADTHAVET_TEST_A'] == 'from_env'
+
+
+def test_missing_file_ignored(tmp_path):
+    """Test that a missing .env file is not an error"""
+    load_env(tmp_path / 'missing.env')
+
+
+def test_skipped_on_render(tmp_path, monkeypatch):
+    """Test that the file is not read when running on Render"""
+    env_file = tmp_path / '.env'
+    env_file.write_text('STADTHAVET_TEST_A=from_file\n')
+    monkeypatch.setenv('RENDER', 'true')
+    monkeypatch.delenv('STADTHAVET_TEST_A', raising=False)
+
+    load_env(env_file)
+
+    assert 'STADTHAVET_TEST_A' not in os.environ
@@ -0,0 +1,29 @@
+"""
+Tests for API response JSON decoding
+"""
+
+import json
+from unittest.mock import Mock, patch
+from lib.fast_json import response_json
+
+
+def make_response(body):
+    """Build a fake requests.Response with a raw body"""
+    response = Mock()
+    response.content = body
+    response.json.side_effect = lambda: json.loads(body)
+    return response
+
+
+def test_decodes_body():
+    """Test that the raw body is decoded"""
+    response = make_response(b'[{"mmsi": 257898600, "speedOverGround": 12.5}]')
+    assert response_json(response) == [{'mmsi': 257898600, 'speedOverGround': 12.5}]
+
+
+def test_falls_back_without_orjson():
+    """Test that response.json() is used when orjson is not installed"""
+    response = make_response(b'{"data": []}')
+    with patch('lib.fast_json.orjson', None):
+        assert response_json(response) == {'data': []}
+    response.json.assert_called_once()
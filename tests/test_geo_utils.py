@@ -5,9 +5,14 @@ Tests for geographical utility functions
 import pytest
 from lib.geo_utils import (
     ccw,
+    line_side,
     line_segments_intersect,
     haversine_distance,
     is_in_waiting_zone,
+    waiting_zone_bbox,
+    waiting_zone_checker,
+    stad_line_bbox,
+    stad_line_distance,
     distance_to_stad_line
 )
 
@@ -37,6 +42,25 @@ class TestCCW:
         assert ccw(A, B, C) is False
 
 
+class TestLineSide:
+    """Tests for the fixed-line side test"""
+
+    def test_matches_ccw(self):
+        """Test that line_side agrees with ccw for points around the Stad line"""
+        line_start = (5.100380, 62.194513)
+        line_end = (4.342984, 62.442407)
+        side = line_side(line_start, line_end)
+        for lon in (4.0, 4.5, 4.7, 5.0, 5.5):
+            for lat in (62.0, 62.2, 62.3, 62.4, 62.6):
+                point = (lon, lat)
+                assert side(point) == ccw(point, line_start, line_end)
+
+    def test_collinear(self):
+        """Test that points on the line give the same result as ccw"""
+        side = line_side((0, 0), (1, 1))
+        assert side((2, 2)) is False
+
+
 class TestLineSegmentsIntersect:
     """Tests for line segment intersection"""
 
@@ -80,6 +104,14 @@ class TestLineSegmentsIntersect:
         ship_end2 = (5.3, 62.3)    # Still east side
         assert line_segments_intersect(stad_start, stad_end, ship_start2, ship_end2) is False
 
+    def test_line_extension_not_intersecting(self):
+        """Test a segment crossing the extension of the other, beyond its bounding box"""
+        A = (0, 0)
+        B = (1, 1)
+        C = (3, 2)
+        D = (2, 3)
+        assert line_segments_intersect(A, B, C, D) is False
+
 
 class TestHaversineDistance:
     """Tests for Haversine distance calculation"""
@@ -152,6 +184,60 @@ class TestIsInWaitingZone:
         assert 9 <= dist <= 11
 
 
+class TestWaitingZoneBbox:
+    """Tests for waiting zone bounding box"""
+
+    def test_box_contains_zone(self):
+        """Test that every point on the zone boundary lies inside the box"""
+        zone_config = {
+            'center_lat': 62.25,
+            'center_lon': 5.3,
+            'radius_km': 10
+        }
+        min_lat, max_lat, min_lon, max_lon = waiting_zone_bbox(zone_config)
+        step = 0.0005
+        lat = min_lat - 0.01
+        while lat <= max_lat + 0.01:
+            for lon in (min_lon - step, max_lon + step):
+                assert not is_in_waiting_zone(lat, lon, zone_config)
+            lat += step
+        lon = min_lon - 0.01
+        while lon <= max_lon + 0.01:
+            for lat in (min_lat - step, max_lat + step):
+                assert not is_in_waiting_zone(lat, lon, zone_config)
+            lon += step
+
+    def test_box_is_tight(self):
+        """Test that the box is not much larger than the zone"""
+        zone_config = {
+            'center_lat': 62.0,
+            'center_lon': 5.0,
+            'radius_km': 10
+        }
+        min_lat, max_lat, min_lon, max_lon = waiting_zone_bbox(zone_config)
+        assert 9.9 <= haversine_distance(62.0, 5.0, max_lat, 5.0) <= 10.1
+        assert 9.9 <= haversine_distance(62.0, 5.0, 62.0, max_lon) <= 10.1
+
+
+class TestWaitingZoneChecker:
+    """Tests for the fast waiting zone membership test"""
+
+    def test_matches_haversine(self):
+        """Test that results match is_in_waiting_zone, including near the edge"""
+        import random
+        rnd = random.Random(0)
+        zone_config = {
+            'center_lat': 62.25,
+            'center_lon': 5.3,
+            'radius_km': 10
+        }
+        check = waiting_zone_checker(zone_config)
+        for _ in range(20000):
+            lat = 62.25 + rnd.uniform(-0.1, 0.1)
+            lon = 5.3 + rnd.uniform(-0.2, 0.2)
+            assert check(lat, lon) == is_in_waiting_zone(lat, lon, zone_config)
+
+
 class TestDistanceToStadLine:
     """Tests for distance to Stad line calculation"""
 
@@ -189,3 +275,54 @@ class TestDistanceToStadLine:
         # Point at midpoint should have distance close to 0
         dist = distance_to_stad_line(mid_lat, mid_lon, stad_start, stad_end)
         assert dist < 1  # Should be very close
+
+    def test_distance_along_segment(self):
+        """Test that a point beside the line, between start and midpoint, is measured to the line"""
+        stad_start = (5.100380, 62.194513)
+        stad_end = (4.342984, 62.442407)
+        # A quarter of the way along the line
+        lat = 62.194513 + (62.442407 - 62.194513) / 4
+        lon = 5.100380 + (4.342984 - 5.100380) / 4
+        dist = distance_to_stad_line(lat, lon, stad_start, stad_end)
+        assert dist < 0.1
+        # 0.05 degrees north of that point is a few km from the line, but
+        # farther than that from the start, midpoint and end
+        dist = distance_to_stad_line(lat + 0.05, lon, stad_start, stad_end)
+        assert 1 < dist < 5
+        mid_lat = (62.194513 + 62.442407) / 2
+        mid_lon = (5.100380 + 4.342984) / 2
+        assert haversine_distance(lat + 0.05, lon, mid_lat, mid_lon) > 5
+
+    def test_distance_beyond_end_matches_haversine(self):
+        """Test that points beyond the line's ends are measured to the nearest end"""
+        stad_start = (5.100380, 62.194513)
+        stad_end = (4.342984, 62.442407)
+        distance = stad_line_distance(stad_start, stad_end)
+        assert distance(62.5, 4.0) == pytest.approx(haversine_distance(62.5, 4.0, 62.442407, 4.342984), rel=0.01)
+        assert distance(62.0, 5.6) == pytest.approx(haversine_distance(62.0, 5.6, 62.194513, 5.100380), rel=0.01)
+
+
+class TestStadLineBbox:
+    """Tests for the bounding box around the Stad line"""
+
+    def test_bbox_contains_points_within_margin(self):
+        """Test that every point measured within the margin lies inside the box"""
+        stad_start = (5.100380, 62.194513)
+        stad_end = (4.342984, 62.442407)
+        distance = stad_line_distance(stad_start, stad_end)
+        min_lat, max_lat, min_lon, max_lon = stad_line_bbox(stad_start, stad_end, 50)
+        for i in range(61):
+            for j in range(61):
+                lat = 61.5 + i * 0.025
+                lon = 3.0 + j * 0.06
+                if distance(lat, lon) <= 50:
+                    assert min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+
+    def test_bbox_excludes_far_points(self):
+        """Test that points well beyond the margin fall outside the box"""
+        stad_start = (5.100380, 62.194513)
+        stad_end = (4.342984, 62.442407)
+        min_lat, max_lat, min_lon, max_lon = stad_line_bbox(stad_start, stad_end, 50)
+        assert max_lat < 63.0
+        assert min_lat > 61.5
+        assert max_lon < 6.2
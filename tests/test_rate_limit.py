@@ -0,0 +1,62 @@
+"""
+Tests for the token bucket rate limiter
+"""
+
+from unittest.mock import patch
+from lib.rate_limit import TokenBucket
+
+
+class FakeClock:
+    """Monotonic clock that only moves when sleep() is called"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_bucket(capacity, refill_per_sec):
+    """Build a bucket driven by a fake clock"""
+    clock = FakeClock()
+    with patch('lib.rate_limit.time', clock):
+        bucket = TokenBucket(capacity, refill_per_sec)
+    return bucket, clock
+
+
+class TestTokenBucket:
+    """Tests for TokenBucket"""
+
+    def test_burst_does_not_wait(self):
+        """Test that up to capacity requests go through without sleeping"""
+        bucket, clock = make_bucket(4, 0.1)
+        with patch('lib.rate_limit.time', clock):
+            for _ in range(4):
+                assert bucket.acquire() == 0.0
+        assert clock.sleeps == []
+
+    def test_waits_for_refill_when_empty(self):
+        """Test that an empty bucket sleeps until a token is refilled"""
+        bucket, clock = make_bucket(4, 0.1)
+        with patch('lib.rate_limit.time', clock):
+            for _ in range(4):
+                bucket.acquire()
+            assert bucket.acquire() == 10.0
+            assert bucket.acquire() == 10.0
+        assert clock.sleeps == [10.0, 10.0]
+
+    def test_refills_over_time(self):
+        """Test that tokens come back while idle, up to capacity"""
+        bucket, clock = make_bucket(4, 0.1)
+        with patch('lib.rate_limit.time', clock):
+            for _ in range(4):
+                bucket.acquire()
+            clock.now += 1000
+            for _ in range(4):
+                assert bucket.acquire() == 0.0
+            assert bucket.acquire() == 10.0
@@ -8,26 +8,23 @@ for all ships every time, and when rate limiting kicked in, it would overwrite
 existing length data with NULL values.
 """
 
+import json
 import unittest
-import tempfile
-import os
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import patch
 from datetime import datetime, timezone
 
 from lib.database import Database
-from lib.barentswatch_api import fetch_and_store_track
+from lib.barentswatch_api import fetch_and_store_track, get_ships_with_info, store_track, update_ships
 
 
 class TestShipInfoPersistence(unittest.TestCase):
     """Test that ship info persists across multiple fetch_and_store_track calls"""
 
     def setUp(self):
-        """Create a temporary SQLite database for testing"""
-        self.db_fd, self.db_path = tempfile.mkstemp()
-
-        # Create config with temp database and all required keys
+        """Create an in-memory SQLite database for testing"""
+        # Create config with a private in-memory database and all required keys
         self.config = {
-            'sqlite_db': self.db_path,
+            'sqlite_db': ':memory:',
             'marinesia_key': 'test_key',
             'track_url': 'https://test.api/track',  # Not used in tests (mocked)
             'stad_line_start': (5.100380, 62.194513),
@@ -50,13 +47,12 @@ class TestShipInfoPersistence(unittest.TestCase):
         self.db.create_tables()
 
     def tearDown(self):
-        """Clean up temporary database"""
+        """Close the database, which discards it"""
         self.db.close()
-        os.close(self.db_fd)
-        os.unlink(self.db_path)
 
+    @patch('lib.barentswatch_api.SESSION.get')
     @patch('lib.barentswatch_api.get_ship_info')
-    def test_ship_info_not_overwritten_on_second_fetch(self, mock_get_ship_info):
+    def test_ship_info_not_overwritten_on_second_fetch(self, mock_get_ship_info, mock_requests):
         """
         Test that when we process a ship twice, the second time doesn't overwrite
         the ship info (length, width, callsign) from the first time.
@@ -91,21 +87,20 @@ class TestShipInfoPersistence(unittest.TestCase):
             }
         ]
 
+        mock_response = mock_requests.return_value
+        mock_response.status_code = 200
+        mock_response.json.return_value = mock_positions
+        mock_response.content = json.dumps(mock_positions).encode()
+
         # FIRST FETCH - Should call get_ship_info and store the data
-        with patch('lib.barentswatch_api.requests.get') as mock_requests:
-            mock_response = Mock()
-            mock_response.status_code = 200
-            mock_response.json.return_value = mock_positions
-            mock_requests.return_value = mock_response
-
-            result = fetch_and_store_track(
-                self.db,
-                access_token,
-                test_mmsi,
-                '2024-10-24T09:00:00Z',
-                '2024-10-24T11:00:00Z',
-                self.config
-            )
+        result = fetch_and_store_track(
+            self.db,
+            access_token,
+            test_mmsi,
+            '2024-10-24T09:00:00Z',
+            '2024-10-24T11:00:00Z',
+            self.config
+        )
 
         # Verify first fetch was successful
         self.assertIsNotNone(result)
@@ -133,20 +128,15 @@ class TestShipInfoPersistence(unittest.TestCase):
         # Simulate that get_ship_info would return None (rate limited or API down)
         mock_get_ship_info.return_value = None
 
-        with patch('lib.barentswatch_api.requests.get') as mock_requests:
-            mock_response = Mock()
-            mock_response.status_code = 200
-            mock_response.json.return_value = mock_positions
-            mock_requests.return_value = mock_response
-
-            result = fetch_and_store_track(
-                self.db,
-                access_token,
-                test_mmsi,
-                '2024-10-24T11:00:00Z',
-                '2024-10-24T13:00:00Z',
-                self.config
-            )
+        # The session mock keeps returning the same positions
+        result = fetch_and_store_track(
+            self.db,
+            access_token,
+            test_mmsi,
+            '2024-10-24T11:00:00Z',
+            '2024-10-24T13:00:00Z',
+            self.config
+        )
 
         # Verify second fetch was successful
         self.assertIsNotNone(result)
@@ -167,8 +157,9 @@ class TestShipInfoPersistence(unittest.TestCase):
         self.assertEqual(width, 21.0, "Width should NOT be overwritten with NULL")
         self.assertEqual(callsign, 'LMRY', "Callsign should NOT be overwritten with NULL")
 
+    @patch('lib.barentswatch_api.SESSION.get')
     @patch('lib.barentswatch_api.get_ship_info')
-    def test_new_ship_fetches_info(self, mock_get_ship_info):
+    def test_new_ship_fetches_info(self, mock_get_ship_info, mock_requests):
         """
         Test that when we see a new ship (not in database), we DO fetch ship info
         """
@@ -197,20 +188,19 @@ class TestShipInfoPersistence(unittest.TestCase):
             }
         ]
 
-        with patch('lib.barentswatch_api.requests.get') as mock_requests:
-            mock_response = Mock()
-            mock_response.status_code = 200
-            mock_response.json.return_value = mock_positions
-            mock_requests.return_value = mock_response
-
-            result = fetch_and_store_track(
-                self.db,
-                access_token,
-                test_mmsi,
-                '2024-10-24T09:00:00Z',
-                '2024-10-24T11:00:00Z',
-                self.config
-            )
+        mock_response = mock_requests.return_value
+        mock_response.status_code = 200
+        mock_response.json.return_value = mock_positions
+        mock_response.content = json.dumps(mock_positions).encode()
+
+        result = fetch_and_store_track(
+            self.db,
+            access_token,
+            test_mmsi,
+            '2024-10-24T09:00:00Z',
+            '2024-10-24T11:00:00Z',
+            self.config
+        )
 
         # Verify fetch was successful
         self.assertIsNotNone(result)
@@ -231,6 +221,128 @@ class TestShipInfoPersistence(unittest.TestCase):
         self.assertEqual(width, 10.0)
         self.assertEqual(callsign, 'TEST')
 
+    @patch('lib.barentswatch_api.get_ship_info')
+    def test_prefetched_ship_set(self, mock_get_ship_info):
+        """
+        Test that the prefetched set of ships with info is used and kept up to date
+        """
+
+        test_mmsi = 888888888
+        mock_get_ship_info.return_value = {'length': 80.0, 'width': 14.0, 'callsign': 'SET'}
+
+        mock_positions = [
+            {
+                'mmsi': test_mmsi,
+                'name': 'SET SHIP',
+                'shipType': 70,
+                'latitude': 62.0,
+                'longitude': 5.0,
+                'msgtime': '2024-10-24T10:00:00Z',
+                'speedOverGround': 10.0,
+                'courseOverGround': 90.0
+            }
+        ]
+
+        ships_with_info = get_ships_with_info(self.db)
+        self.assertNotIn(test_mmsi, ships_with_info)
+
+        store_track(self.db, test_mmsi, mock_positions, self.config, ships_with_info)
+        self.assertIn(test_mmsi, ships_with_info)
+        self.assertEqual(get_ships_with_info(self.db), ships_with_info)
+
+        # Second track for the same ship must not look it up again
+        store_track(self.db, test_mmsi, mock_positions, self.config, ships_with_info)
+        self.assertEqual(mock_get_ship_info.call_count, 1,
+                        "get_ship_info should only be called once per ship")
+
+    @patch('lib.barentswatch_api.get_ship_info')
+    def test_deferred_ship_updates(self, mock_get_ship_info):
+        """
+        Test that name/type updates for known ships are collected and written in bulk
+        """
+
+        test_mmsi = 777777777
+        mock_get_ship_info.return_value = {'length': 60.0, 'width': 12.0, 'callsign': 'BULK'}
+
+        mock_positions = [
+            {
+                'mmsi': test_mmsi,
+                'name': 'OLD NAME',
+                'shipType': 70,
+                'latitude': 62.0,
+                'longitude': 5.0,
+                'msgtime': '2024-10-24T10:00:00Z',
+                'speedOverGround': 10.0,
+                'courseOverGround': 90.0
+            }
+        ]
+
+        ships_with_info = get_ships_with_info(self.db)
+        ship_updates = {}
+
+        # A new ship is written right away, its positions reference it
+        store_track(self.db, test_mmsi, mock_positions, self.config, ships_with_info, ship_updates)
+        self.assertEqual(ship_updates, {})
+
+        mock_positions[0]['name'] = 'NEW NAME'
+        mock_positions[0]['msgtime'] = '2024-10-24T11:00:00Z'
+        store_track(self.db, test_mmsi, mock_positions, self.config, ships_with_info, ship_updates)
+        self.assertIn(test_mmsi, ship_updates)
+
+        self.db.execute('SELECT name FROM ships WHERE mmsi = ?', (test_mmsi,))
+        self.assertEqual(self.db.fetchone()[0], 'OLD NAME')
+
+        self.assertEqual(update_ships(self.db, ship_updates), 1)
+
+        self.db.execute('SELECT name, length, callsign FROM ships WHERE mmsi = ?', (test_mmsi,))
+        self.assertEqual(self.db.fetchone(), ('NEW NAME', 60.0, 'BULK'))
+
+    @patch('lib.barentswatch_api.get_ship_info')
+    def test_latest_position_only_moves_forward(self, mock_get_ship_info):
+        """
+        Test that storing a track keeps the ship's newest position in latest_positions
+        """
+
+        test_mmsi = 666666666
+        mock_get_ship_info.return_value = None
+
+        def track(msgtime, lat):
+            return [{
+                'mmsi': test_mmsi,
+                'name': 'LATEST',
+                'shipType': 70,
+                'latitude': lat,
+                'longitude': 5.0,
+                'msgtime': msgtime,
+                'speedOverGround': 10.0,
+                'courseOverGround': 90.0
+            }]
+
+        store_track(self.db, test_mmsi, track('2024-10-24T10:00:00Z', 62.0), self.config)
+        store_track(self.db, test_mmsi, track('2024-10-24T12:00:00Z', 62.2), self.config)
+        # An older track arriving late must not move the position back
+        store_track(self.db, test_mmsi, track('2024-10-24T11:00:00Z', 62.1), self.config)
+
+        self.db.execute('SELECT timestamp, latitude FROM latest_positions WHERE mmsi = ?', (test_mmsi,))
+        self.assertEqual(self.db.fetchall(), [('2024-10-24T12:00:00Z', 62.2)])
+
+    def test_failed_lookups_retried_after_retry_days(self):
+        """
+        Test that ships without looked-up data are only retried once the lookup is old
+        """
+
+        self.db.execute('''
+            INSERT INTO ships (mmsi, name, length, ship_info_fetched_at) VALUES
+                (111111111, 'FOUND OLD', 50.0, '2020-01-01 00:00:00'),
+                (222222222, 'MISSING OLD', NULL, '2020-01-01 00:00:00'),
+                (333333333, 'MISSING NEW', NULL, datetime('now')),
+                (444444444, 'NEVER', NULL, NULL)
+        ''')
+        self.db.commit()
+
+        self.assertEqual(get_ships_with_info(self.db), {111111111, 222222222, 333333333})
+        self.assertEqual(get_ships_with_info(self.db, retry_days=30), {111111111, 333333333})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,92 @@
+"""
+Tests for Marinesia ship lookups
+"""
+
+from unittest.mock import Mock, patch
+import pytest
+from lib import ship_lookup
+from lib.ship_lookup import get_ship_info, get_ship_info_batch
+
+
+@pytest.fixture
+def marinesia(monkeypatch):
+    """Empty lookup cache, no rate limit waits, and a mocked Marinesia session"""
+    monkeypatch.setenv('MARINESIA_KEY', 'test_key')
+    monkeypatch.setattr(ship_lookup, '_CACHE', {})
+    monkeypatch.setattr(ship_lookup, '_BUCKET', Mock(acquire=Mock(return_value=0.0)))
+    with patch('lib.ship_lookup.SESSION.get') as mock_get:
+        yield mock_get
+
+
+class TestGetShipInfoCache:
+    """Tests for the in-process lookup cache"""
+
+    def test_found_ship_cached(self, marinesia):
+        """Test that a found ship is not looked up again"""
+        marinesia.return_value = Mock(status_code=200, content=b'{"error": false, "data": {"length": 50.0, "width": 10.0}}')
+
+        first = get_ship_info(257898600, {})
+        second = get_ship_info(257898600, {})
+
+        assert first['length'] == 50.0
+        assert second == first
+        assert marinesia.call_count == 1
+
+    def test_missing_ship_cached_until_expiry(self, marinesia):
+        """Test that a failed lookup is cached, but retried once it expires"""
+        marinesia.return_value = Mock(status_code=404)
+
+        assert get_ship_info(257898600, {}) is None
+        assert get_ship_info(257898600, {}) is None
+        assert marinesia.call_count == 1
+
+        expires_at, info = ship_lookup._CACHE[257898600]
+        ship_lookup._CACHE[257898600] = (expires_at - ship_lookup.CACHE_TTL_MISSING, info)
+        assert get_ship_info(257898600, {}) is None
+        assert marinesia.call_count == 2
+
+
+class TestRateLimitRetry:
+    """Tests for lookups Marinesia answered with 429"""
+
+    def test_retry_after_honoured(self, marinesia):
+        """Test that a 429 waits for Retry-After and takes a rate limit token before retrying"""
+        marinesia.side_effect = [
+            Mock(status_code=429, headers={'Retry-After': '7'}),
+            Mock(status_code=200, content=b'{"error": false, "data": {"length": 50.0}}'),
+        ]
+
+        with patch('lib.ship_lookup.time.sleep') as mock_sleep:
+            assert get_ship_info(257898600, {})['length'] == 50.0
+
+        mock_sleep.assert_called_once_with(7.0)
+        assert ship_lookup._BUCKET.acquire.call_count == 2
+
+    def test_gives_up_after_retries(self, marinesia):
+        """Test that a ship still rate limited after the retries is skipped"""
+        marinesia.return_value = Mock(status_code=429, headers={})
+
+        with patch('lib.ship_lookup.time.sleep') as mock_sleep:
+            assert get_ship_info(257898600, {}) is None
+
+        assert marinesia.call_count == ship_lookup.RATE_LIMIT_RETRIES + 1
+        mock_sleep.assert_called_with(ship_lookup.RETRY_AFTER_DEFAULT)
+
+
+class TestGetShipInfoBatch:
+    """Tests for concurrent ship lookups"""
+
+    @patch('lib.ship_lookup.get_ship_info')
+    def test_returns_info_per_mmsi(self, mock_get_ship_info):
+        """Test that every MMSI is looked up once and keyed by MMSI, failures included"""
+        mock_get_ship_info.side_effect = lambda mmsi, config: {'length': 50.0} if mmsi != 2 else None
+        config = {}
+
+        result = get_ship_info_batch([1, 2, 3], config)
+
+        assert result == {1: {'length': 50.0}, 2: None, 3: {'length': 50.0}}
+        assert sorted(call.args[0] for call in mock_get_ship_info.call_args_list) == [1, 2, 3]
+
+    def test_empty(self):
+        """Test that no MMSIs gives an empty result"""
+        assert get_ship_info_batch([], {}) == {}
@@ -0,0 +1,166 @@
+"""
+Tests for waiting (loitering) detection
+"""
+
+import pytest
+from datetime import datetime, timezone
+from lib.waiting import find_waiting_periods, zone_classifier, max_in_window, next_index_after, to_epoch
+
+
+ZONE_EAST = {'center_lat': 62.25, 'center_lon': 5.3, 'radius_km': 10}
+ZONE_WEST = {'center_lat': 62.25, 'center_lon': 4.2, 'radius_km': 10}
+EAST = (62.25, 5.3)
+WEST = (62.25, 4.2)
+OPEN_SEA = (62.6, 4.8)
+
+
+def periods(positions, speed_threshold=3.0):
+    """Run detection on unclassified positions and return a list of periods"""
+    rows = [row + (None, None) if len(row) == 5 else row for row in positions]
+    return list(find_waiting_periods(rows, ZONE_EAST, ZONE_WEST, speed_threshold))
+
+
+class TestFindWaitingPeriods:
+    """Tests for the waiting state machine"""
+
+    def test_single_period(self):
+        """Test ship waiting in east zone and then leaving"""
+        positions = [
+            (1, 't1', *EAST, 1.0),
+            (1, 't2', *EAST, 2.0),
+            (1, 't3', *OPEN_SEA, 12.0),
+        ]
+        assert periods(positions) == [(1, 'east', 't1', 't3', [1.0, 2.0])]
+
+    def test_speeding_up_ends_period(self):
+        """Test that a fast ship in the zone is not waiting"""
+        positions = [
+            (1, 't1', *WEST, 0.5),
+            (1, 't2', *WEST, 10.0),
+        ]
+        assert periods(positions) == [(1, 'west', 't1', 't2', [0.5])]
+
+    def test_unknown_speed_counts_as_waiting(self):
+        """Test that positions without speed are treated as waiting"""
+        positions = [
+            (1, 't1', *EAST, None),
+            (1, 't2', *EAST, None),
+            (1, 't3', *OPEN_SEA, None),
+        ]
+        assert periods(positions) == [(1, 'east', 't1', 't3', [])]
+
+    def test_zone_change_restarts_period(self):
+        """Test that moving to the other zone starts a new period"""
+        positions = [
+            (1, 't1', *EAST, 1.0),
+            (1, 't2', *WEST, 1.0),
+            (1, 't3', *OPEN_SEA, 12.0),
+        ]
+        assert periods(positions) == [(1, 'west', 't2', 't3', [1.0])]
+
+    def test_open_period_is_dropped(self):
+        """Test that a period still open at the end of the track is not reported"""
+        positions = [
+            (1, 't1', *EAST, 1.0),
+            (1, 't2', *EAST, 1.0),
+        ]
+        assert periods(positions) == []
+
+    def test_ship_change_resets_state(self):
+        """Test that waiting state does not leak between ships"""
+        positions = [
+            (1, 't1', *EAST, 1.0),
+            (2, 't2', *OPEN_SEA, 12.0),
+            (2, 't3', *WEST, 1.0),
+            (2, 't4', *OPEN_SEA, 12.0),
+        ]
+        assert periods(positions) == [(2, 'west', 't3', 't4', [1.0])]
+
+    def test_speed_threshold(self):
+        """Test custom speed threshold"""
+        positions = [
+            (1, 't1', *EAST, 4.0),
+            (1, 't2', *OPEN_SEA, 12.0),
+        ]
+        assert periods(positions, speed_threshold=3.0) == []
+        assert periods(positions, speed_threshold=5.0) == [(1, 'east', 't1', 't2', [4.0])]
+
+    def test_stored_zone_flags_are_used(self):
+        """Test that stored zone flags are trusted over the coordinates"""
+        positions = [
+            (1, 't1', *OPEN_SEA, 1.0, True, False),
+            (1, 't2', *EAST, 1.0, False, False),
+        ]
+        assert periods(positions) == [(1, 'east', 't1', 't2', [1.0])]
+
+    def test_track_ends(self):
+        """Test that each ship's last position and open period are reported"""
+        positions = [
+            (1, 't1', *EAST, 1.0, None, None),
+            (1, 't2', *OPEN_SEA, 12.0, None, None),
+            (2, 't3', *WEST, 1.0, None, None),
+            (2, 't4', *WEST, 1.0, None, None),
+        ]
+        track_ends = {}
+        list(find_waiting_periods(positions, ZONE_EAST, ZONE_WEST, 3.0, track_ends))
+        assert track_ends == {1: ('t2', None), 2: ('t4', 't3')}
+
+
+class TestZoneClassifier:
+    """Tests for waiting zone classification"""
+
+    def test_classify(self):
+        """Test positions in each zone and in open sea"""
+        classify = zone_classifier(ZONE_EAST, ZONE_WEST)
+        assert classify(*EAST) == (True, False)
+        assert classify(*WEST) == (False, True)
+        assert classify(*OPEN_SEA) == (False, False)
+
+
+class TestMaxInWindow:
+    """Tests for weather window lookup"""
+
+    def test_window_is_inclusive(self):
+        """Test that observations on the window bounds are included"""
+        times = [10, 20, 30, 40]
+        values = [1.0, 9.0, 4.0, 12.0]
+        assert max_in_window(times, values, 20, 30) == 9.0
+        assert max_in_window(times, values, 10, 40) == 12.0
+
+    def test_empty_window(self):
+        """Test window without observations"""
+        times = [10, 20]
+        values = [1.0, 2.0]
+        assert max_in_window(times, values, 11, 19) is None
+        assert max_in_window([], [], 0, 100) is None
+
+
+class TestNextIndexAfter:
+    """Tests for next crossing lookup"""
+
+    def test_strictly_after(self):
+        """Test that a timestamp equal to the value is skipped"""
+        times = [10, 20, 30]
+        assert next_index_after(times, 20) == 2
+        assert next_index_after(times, 5) == 0
+
+    def test_none_after(self):
+        """Test lookup past the last timestamp"""
+        assert next_index_after([10, 20], 20) is None
+        assert next_index_after([], 0) is None
+
+
+class TestToEpoch:
+    """Tests for timestamp conversion"""
+
+    def test_string_and_datetime_agree(self):
+        """Test that SQLite strings and PostgreSQL datetimes give the same value"""
+        dt = datetime(2024, 1, 15, 12, 30, tzinfo=timezone.utc)
+        assert to_epoch('2024-01-15T12:30:00Z') == dt.timestamp()
+        assert to_epoch('2024-01-15T12:30:00+00:00') == dt.timestamp()
+        assert to_epoch(dt) == dt.timestamp()
+
+    def test_naive_is_utc(self):
+        """Test that timestamps without timezone are treated as UTC"""
+        assert to_epoch('1970-01-01T00:01:00') == 60
+        assert to_epoch(datetime(1970, 1, 1, 0, 1)) == 60
@@ -3,36 +3,81 @@
 Web frontend for Stadthavet AIS data visualization
 """
 
-from flask import Flask, render_template, jsonify
+from flask import Flask, g, render_template, jsonify, request
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 import os
 import sys
+import decimal
+import gzip
+import hashlib
 import logging
+import queue
+import threading
+import time
+import uuid
+import zlib
 from pathlib import Path
 from datetime import datetime, timedelta
 import markdown
 
+from lib.env import load_env
+
 # Load .env file if it exists
-env_path = Path(__file__).parent / '.env'
-if env_path.exists():
-    with open(env_path) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                os.environ.setdefault(key, value)
+load_env(Path(__file__).parent / '.env')
 
 # Database detection
 USE_POSTGRES = os.environ.get('RENDER') is not None or os.environ.get('DATABASE_URL') is not None
 
+# The SQL below is built once at startup for the database in use
 if USE_POSTGRES:
     import psycopg2
     from psycopg2.extras import RealDictCursor
+    from psycopg2.pool import ThreadedConnectionPool
     DB_URL = os.environ.get('DATABASE_URL')
+    PARAM = '%s'
+    LAST_24H = "NOW() - INTERVAL '24 hours'"
+    LAST_48H = "NOW() - INTERVAL '48 hours'"
+    LATEST_POSITIONS_EXISTS = "SELECT to_regclass('latest_positions') IS NOT NULL as present"
+    # Row estimate kept by autovacuum; -1 until the table is first analyzed
+    POSITIONS_ESTIMATE = "SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = 'positions'::regclass"
 else:
     import sqlite3
+    PARAM = '?'
+    LAST_24H = "datetime('now', '-24 hours')"
+    LAST_48H = "datetime('now', '-48 hours')"
+    LATEST_POSITIONS_EXISTS = "SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'latest_positions') as present"
+    # Positions are never deleted, so the newest id is the row count
+    POSITIONS_ESTIMATE = "SELECT COALESCE(MAX(id), 0) FROM positions"
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider serializing with orjson, several times faster than the stdlib json"""
+
+    options = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    @staticmethod
+    def _default(o):
+        # Types orjson doesn't handle, serialized as Flask's default provider does
+        if isinstance(o, (decimal.Decimal, uuid.UUID)):
+            return str(o)
+        if hasattr(o, '__html__'):
+            return str(o.__html__())
+        raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self._default, option=self.options).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 
 # Configure logging
 log_level = os.environ.get('LOG_LEVEL', 'INFO')
@@ -51,144 +96,312 @@ allowed_origins = os.environ.get('ALLOWED_ORIGINS', '*')
 CORS(app, resources={r"/api/*": {"origins": allowed_origins}})
 logger.info(f"CORS enabled for origins: {allowed_origins}")
 
+# Responses cached in this process: key -> (expires_at, JSON body). The data
+# only changes when the collector runs (every 12 hours), so the aggregate
+# endpoints don't need to hit the database for every visitor.
+_CACHE = {}
+_CACHE_LOCKS = {}
+_CACHE_LOCKS_LOCK = threading.Lock()
+
+def cached_json(key, ttl, compute):
+    """
+    Return a JSON response for compute(), reusing it for ttl seconds
+
+    Concurrent requests for an expired key wait for the one computing it
+    instead of all querying the database.
+
+    Args:
+        key: Cache key, e.g. the route name
+        ttl: Seconds the result stays valid
+        compute: Function returning the JSON-serializable result
+
+    Returns:
+        Flask response with the JSON body
+    """
+    cached = _CACHE.get(key)
+    if cached is None or cached[0] <= time.monotonic():
+        with _CACHE_LOCKS_LOCK:
+            lock = _CACHE_LOCKS.setdefault(key, threading.Lock())
+        with lock:
+            cached = _CACHE.get(key)
+            if cached is None or cached[0] <= time.monotonic():
+                cached = (time.monotonic() + ttl, app.json.dumps(compute()))
+                _CACHE[key] = cached
+    return app.response_class(cached[1], mimetype='application/json')
+
+# Database connections are reused between requests: idle SQLite connections
+# wait in a queue (the server starts a thread per request), PostgreSQL ones in
+# a pool
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))  # Max concurrent PostgreSQL requests
+DB_POOL_TIMEOUT = 30  # Seconds a request waits for a free PostgreSQL connection
+_idle_sqlite = queue.SimpleQueue()
+_pool = None
+_pool_lock = threading.Lock()
+# The pool raises instead of waiting when all connections are in use (e.g.
+# held by slow streaming responses), so requests queue for a slot here first
+_pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+
 def get_db():
-    """Get database connection"""
+    """Get the request's database connection; it is handed back when the request ends"""
+    if 'db' in g:
+        return g.db
     try:
         if USE_POSTGRES:
-            logger.debug("Connecting to PostgreSQL database")
-            return psycopg2.connect(DB_URL, cursor_factory=RealDictCursor)
+            global _pool
+            if _pool is None:
+                with _pool_lock:
+                    if _pool is None:
+                        logger.info("Connecting to PostgreSQL database")
+                        _pool = ThreadedConnectionPool(1, DB_POOL_SIZE, DB_URL, cursor_factory=RealDictCursor)
+            if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+                raise RuntimeError(f"No free database connection after {DB_POOL_TIMEOUT} s")
+            try:
+                g.db = _pool.getconn()
+            except Exception:
+                _pool_slots.release()
+                raise
         else:
-            logger.debug("Connecting to SQLite database")
-            conn = sqlite3.connect('stadthavet_ais.db')
-            conn.row_factory = sqlite3.Row
-            return conn
+            try:
+                conn = _idle_sqlite.get_nowait()
+            except queue.Empty:
+                logger.debug("Connecting to SQLite database")
+                # Connections move between server threads, but only one uses it at a time
+                conn = sqlite3.connect('stadthavet_ais.db', check_same_thread=False)
+                conn.execute('PRAGMA temp_store=MEMORY')
+                conn.execute('PRAGMA cache_size=-65536')  # 64 MB
+                conn.execute('PRAGMA mmap_size=268435456')  # 256 MB
+            g.db = conn
+        return g.db
     except Exception as e:
         logger.error(f"Database connection error: {e}")
         raise
 
+def fetch_dicts(cursor):
+    """All remaining rows of the last query, as dicts keyed by column name"""
+    if USE_POSTGRES:
+        # RealDictCursor rows are dicts already
+        return cursor.fetchall()
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def stream_cursor(name):
+    """
+    Cursor for a query whose rows are streamed with stream_json_array
+
+    On PostgreSQL this is a named (server-side) cursor, so the rows stay on
+    the server until they are fetched.
+
+    Args:
+        name: Cursor name, unique within the request
+
+    Returns:
+        Database cursor
+    """
+    conn = get_db()
+    return conn.cursor(name) if USE_POSTGRES else conn.cursor()
+
+def stream_json_array(cursor, transform=None, batch_size=1000):
+    """
+    Response streaming the rows of the last query as a JSON array of objects
+
+    Rows are fetched and serialized batch_size at a time, so neither all rows
+    nor the whole JSON body are held in memory. The response takes over the
+    request's database connection from release_db and hands it back once the
+    body has been sent (or the client went away).
+
+    Args:
+        cursor: Cursor the query was executed on
+        transform: Optional function applied to each row dict before
+                   serializing; rows it returns None for are left out
+        batch_size: Rows fetched per round-trip
+
+    Returns:
+        Flask streaming response
+    """
+    def generate():
+        separator = '['
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if not USE_POSTGRES:
+                columns = [column[0] for column in cursor.description]
+                rows = [dict(zip(columns, row)) for row in rows]
+            if transform is not None:
+                rows = [row for row in map(transform, rows) if row is not None]
+                if not rows:
+                    continue
+            yield separator + ','.join(app.json.dumps(row) for row in rows)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+    conn = cursor.connection
+    if g.get('db') is conn:
+        g.pop('db')
+    response = app.response_class(generate(), mimetype='application/json')
+    response.call_on_close(lambda: release_connection(conn))
+    return response
+
+@app.teardown_appcontext
+def release_db(exc=None):
+    """Hand the request's connection back for reuse, also when the request failed"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        release_connection(conn)
+
+def release_connection(conn):
+    """Hand a connection from get_db back for reuse"""
+    if USE_POSTGRES:
+        # End the read transaction psycopg2 opened, so the pooled connection
+        # doesn't keep an old snapshot; drop connections that have failed
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+        try:
+            _pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            _pool_slots.release()
+    else:
+        _idle_sqlite.put(conn)
+
+# JSON responses are gzipped for clients that accept it; smaller ones
+# aren't worth the overhead
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 4
+
+def gzip_chunks(chunks):
+    """Gzip a streamed body chunk by chunk"""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+# Registered before add_cache_headers so it runs after it, and the ETag is
+# computed over the uncompressed body
+@app.after_request
+def compress_json(response):
+    """Gzip JSON responses when the client accepts it"""
+    if (response.mimetype != 'application/json' or response.status_code != 200
+            or 'Content-Encoding' in response.headers or 'gzip' not in request.accept_encodings):
+        return response
+
+    if response.is_streamed:
+        response.response = gzip_chunks(response.iter_encoded())
+    elif response.content_length is not None and response.content_length >= COMPRESS_MIN_SIZE:
+        response.set_data(gzip.compress(response.get_data(), COMPRESS_LEVEL))
+    else:
+        return response
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+# Browser caching for the API: endpoint -> (max-age, stale-while-revalidate)
+# in seconds. Positions change more often than the aggregates.
+API_CACHE_SECONDS = {
+    'api_stats': (30, 60),
+    'api_crossings': (30, 60),
+    'api_waiting': (30, 60),
+    'api_daily_stats': (30, 60),
+    'api_weather': (30, 60),
+    'api_active_ships': (10, 30),
+    'api_tracks': (10, 30),
+}
+
+@app.after_request
+def add_cache_headers(response):
+    """Let browsers cache API responses and revalidate them with an ETag"""
+    cache_seconds = API_CACHE_SECONDS.get(request.endpoint)
+    if cache_seconds is None or request.method != 'GET' or response.status_code != 200:
+        return response
+
+    max_age, stale = cache_seconds
+    response.headers['Cache-Control'] = f'public, max-age={max_age}, stale-while-revalidate={stale}'
+    if response.is_streamed:
+        # Hashing the body would mean buffering all of it
+        return response
+    response.set_etag(hashlib.blake2b(response.get_data(), digest_size=8).hexdigest(), weak=True)
+    # Answers 304 Not Modified when If-None-Match has the same ETag
+    return response.make_conditional(request)
+
 @app.route('/')
 def index():
     """Main dashboard"""
     return render_template('index.html')
 
-@app.route('/about')
-def about():
-    """About page with markdown content"""
+def render_about():
+    """Render ABOUT.md to HTML"""
     about_file = Path(__file__).parent / 'ABOUT.md'
     if about_file.exists():
         with open(about_file, 'r', encoding='utf-8') as f:
             content = f.read()
-            html_content = markdown.markdown(content, extensions=['extra', 'codehilite'])
-    else:
-        html_content = '<p>About page not found.</p>'
+            return markdown.markdown(content, extensions=['extra', 'codehilite'])
+    return '<p>About page not found.</p>'
 
-    return render_template('about.html', content=html_content)
+# ABOUT.md only changes on deploy, so it is rendered once at startup
+ABOUT_HTML = render_about()
+
+@app.route('/about')
+def about():
+    """About page with markdown content"""
+    return render_template('about.html', content=ABOUT_HTML)
+
+# Scalar statistics for /api/stats, one column each
+STATS_SQL = f'''
+    SELECT
+        (SELECT COUNT(DISTINCT mmsi) FROM ships) as total_ships,
+        (SELECT COUNT(*) FROM crossings) as total_crossings,
+        (SELECT COUNT(*) FROM waiting_events) as total_waiting,
+        (SELECT AVG(duration_minutes) FROM waiting_events) as avg_wait,
+        ({POSITIONS_ESTIMATE}) as total_positions_approx,
+        (SELECT COUNT(*) FROM crossings WHERE crossing_time > {LAST_24H}) as recent_crossings,
+        -- Last data collection time (newest position timestamp)
+        (SELECT MAX(timestamp) FROM positions) as last_data_time,
+        -- Ship length statistics
+        (SELECT COUNT(*) FROM ships WHERE length IS NOT NULL AND length >= 50) as ships_over_50m,
+        (SELECT COUNT(*) FROM ships WHERE length IS NOT NULL AND length < 50) as ships_under_50m,
+        (SELECT COUNT(*) FROM ships WHERE length IS NULL) as ships_unknown_length,
+        -- Crossings by ship size
+        (SELECT COUNT(*) FROM crossings c JOIN ships s ON c.mmsi = s.mmsi
+         WHERE s.length IS NOT NULL AND s.length >= 50) as crossings_over_50m,
+        (SELECT COUNT(*) FROM crossings c JOIN ships s ON c.mmsi = s.mmsi
+         WHERE s.length IS NOT NULL AND s.length < 50) as crossings_under_50m,
+        (SELECT COUNT(*) FROM crossings c JOIN ships s ON c.mmsi = s.mmsi
+         WHERE s.length IS NULL) as crossings_unknown_length,
+        -- Waiting events by ship size
+        (SELECT COUNT(*) FROM waiting_events w JOIN ships s ON w.mmsi = s.mmsi
+         WHERE s.length IS NOT NULL AND s.length >= 50) as waiting_over_50m,
+        (SELECT AVG(duration_minutes) FROM waiting_events w JOIN ships s ON w.mmsi = s.mmsi
+         WHERE s.length IS NOT NULL AND s.length >= 50) as avg_wait_over_50m,
+        (SELECT COUNT(*) FROM waiting_events w JOIN ships s ON w.mmsi = s.mmsi
+         WHERE s.length IS NOT NULL AND s.length < 50) as waiting_under_50m,
+        (SELECT AVG(duration_minutes) FROM waiting_events w JOIN ships s ON w.mmsi = s.mmsi
+         WHERE s.length IS NOT NULL AND s.length < 50) as avg_wait_under_50m
+'''
 
 @app.route('/api/stats')
 def api_stats():
     """Get summary statistics"""
+    return cached_json('stats', 60, _compute_stats)
+
+def _compute_stats():
+    """Summary statistics for /api/stats"""
     conn = get_db()
     cursor = conn.cursor()
 
-    # Overall stats
-    cursor.execute('SELECT COUNT(DISTINCT mmsi) as count FROM ships')
-    row = cursor.fetchone()
-    total_ships = row['count'] if USE_POSTGRES else row[0]
-
-    cursor.execute('SELECT COUNT(*) as count FROM crossings')
-    row = cursor.fetchone()
-    total_crossings = row['count'] if USE_POSTGRES else row[0]
-
-    cursor.execute('SELECT COUNT(*) as count FROM waiting_events')
-    row = cursor.fetchone()
-    total_waiting = row['count'] if USE_POSTGRES else row[0]
-
-    cursor.execute('SELECT AVG(duration_minutes) as avg FROM waiting_events')
-    row = cursor.fetchone()
-    avg_wait = (row['avg'] if USE_POSTGRES else row[0]) or 0
-
-    cursor.execute('SELECT COUNT(*) as count FROM positions')
-    row = cursor.fetchone()
-    total_positions = row['count'] if USE_POSTGRES else row[0]
-
-    # Recent activity (last 24 hours)
-    cursor.execute('''
-        SELECT COUNT(*) as count FROM crossings
-        WHERE crossing_time > datetime('now', '-24 hours')
-    ''' if not USE_POSTGRES else '''
-        SELECT COUNT(*) as count FROM crossings
-        WHERE crossing_time > NOW() - INTERVAL '24 hours'
-    ''')
-    row = cursor.fetchone()
-    recent_crossings = row['count'] if USE_POSTGRES else row[0]
-
-    # Get last data collection time (newest position timestamp)
-    cursor.execute('SELECT MAX(timestamp) as max_time FROM positions')
-    row = cursor.fetchone()
-    last_data_time = row['max_time'] if USE_POSTGRES else row[0]
-
-    # Ship length statistics
-    cursor.execute('''
-        SELECT COUNT(*) as count FROM ships WHERE length IS NOT NULL AND length >= 50
-    ''')
-    row = cursor.fetchone()
-    ships_over_50m = row['count'] if USE_POSTGRES else row[0]
-
-    cursor.execute('''
-        SELECT COUNT(*) as count FROM ships WHERE length IS NOT NULL AND length < 50
-    ''')
-    row = cursor.fetchone()
-    ships_under_50m = row['count'] if USE_POSTGRES else row[0]
-
-    cursor.execute('''
-        SELECT COUNT(*) as count FROM ships WHERE length IS NULL
-    ''')
-    row = cursor.fetchone()
-    ships_unknown_length = row['count'] if USE_POSTGRES else row[0]
-
-    # Crossings by ship size
-    cursor.execute('''
-        SELECT COUNT(*) as count FROM crossings c
-        JOIN ships s ON c.mmsi = s.mmsi
-        WHERE s.length IS NOT NULL AND s.length >= 50
-    ''')
-    row = cursor.fetchone()
-    crossings_over_50m = row['count'] if USE_POSTGRES else row[0]
-
-    cursor.execute('''
-        SELECT COUNT(*) as count FROM crossings c
-        JOIN ships s ON c.mmsi = s.mmsi
-        WHERE s.length IS NOT NULL AND s.length < 50
-    ''')
+    # All the counts and averages in one round-trip
+    cursor.execute(STATS_SQL)
     row = cursor.fetchone()
-    crossings_under_50m = row['count'] if USE_POSTGRES else row[0]
-
-    cursor.execute('''
-        SELECT COUNT(*) as count FROM crossings c
-        JOIN ships s ON c.mmsi = s.mmsi
-        WHERE s.length IS NULL
-    ''')
-    row = cursor.fetchone()
-    crossings_unknown_length = row['count'] if USE_POSTGRES else row[0]
-
-    # Waiting events by ship size
-    cursor.execute('''
-        SELECT COUNT(*) as count, AVG(duration_minutes) as avg_duration FROM waiting_events w
-        JOIN ships s ON w.mmsi = s.mmsi
-        WHERE s.length IS NOT NULL AND s.length >= 50
-    ''')
-    row = cursor.fetchone()
-    waiting_over_50m = row['count'] if USE_POSTGRES else row[0]
-    avg_wait_over_50m = (row['avg_duration'] if USE_POSTGRES else row[1]) or 0
-
-    cursor.execute('''
-        SELECT COUNT(*) as count, AVG(duration_minutes) as avg_duration FROM waiting_events w
-        JOIN ships s ON w.mmsi = s.mmsi
-        WHERE s.length IS NOT NULL AND s.length < 50
-    ''')
-    row = cursor.fetchone()
-    waiting_under_50m = row['count'] if USE_POSTGRES else row[0]
-    avg_wait_under_50m = (row['avg_duration'] if USE_POSTGRES else row[1]) or 0
+    (total_ships, total_crossings, total_waiting, avg_wait, total_positions_approx,
+     recent_crossings, last_data_time,
+     ships_over_50m, ships_under_50m, ships_unknown_length,
+     crossings_over_50m, crossings_under_50m, crossings_unknown_length,
+     waiting_over_50m, avg_wait_over_50m, waiting_under_50m, avg_wait_under_50m) = row.values() if USE_POSTGRES else row
+    avg_wait = avg_wait or 0
+    avg_wait_over_50m = avg_wait_over_50m or 0
+    avg_wait_under_50m = avg_wait_under_50m or 0
 
     # Top 10 ships by crossings
     cursor.execute('''
@@ -219,14 +432,12 @@ def api_stats():
                 'crossings': row[4]
             })
 
-    conn.close()
-
-    return jsonify({
+    return {
         'total_ships': total_ships,
         'total_crossings': total_crossings,
         'total_waiting_events': total_waiting,
         'avg_waiting_time_minutes': round(avg_wait, 1),
-        'total_positions': total_positions,
+        'total_positions_approx': total_positions_approx,
         'recent_crossings_24h': recent_crossings,
         'last_data_collection': last_data_time,
         'top_ships_by_crossings': top_ships,
@@ -250,83 +461,117 @@ def api_stats():
                 'avg_duration_minutes': round(avg_wait_under_50m, 1)
             }
         }
-    })
+    }
+
+# Display name and type for ships in the list endpoints: ships without a
+# name are shown as "Ukjent (<mmsi>)", and missing or 'Type 0' types as "Ukjent"
+SHIP_NAME_COLUMN = "CASE WHEN s.name IS NULL OR TRIM(s.name) = '' THEN 'Ukjent (' || s.mmsi || ')' ELSE s.name END as name"
+SHIP_TYPE_COLUMN = "CASE WHEN s.ship_type_name IS NULL OR s.ship_type_name IN ('', 'Type 0') THEN 'Ukjent' ELSE s.ship_type_name END as ship_type_name"
+
+# Ship names and types for the crossing and waiting lists, looked up in
+# memory instead of joining ships on every request: mmsi -> (name, type)
+SHIP_NAMES_TTL = 600
+_ship_names = {}
+_ship_names_expires = 0.0
+_ship_names_lock = threading.Lock()
+
+def get_ship_names(conn, refresh=False):
+    """
+    Display names and types of all ships, reloaded every SHIP_NAMES_TTL seconds
+
+    Args:
+        conn: Database connection to load them with
+        refresh: Reload now, e.g. for a ship added since the last load
+
+    Returns:
+        dict: mmsi -> (name, ship_type_name)
+    """
+    global _ship_names, _ship_names_expires
+    with _ship_names_lock:
+        if refresh or _ship_names_expires <= time.monotonic():
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT s.mmsi, {SHIP_NAME_COLUMN}, {SHIP_TYPE_COLUMN} FROM ships s')
+            _ship_names = {row['mmsi']: (row['name'], row['ship_type_name']) for row in fetch_dicts(cursor)}
+            _ship_names_expires = time.monotonic() + SHIP_NAMES_TTL
+        return _ship_names
+
+def ship_name_adder(conn):
+    """
+    Build a function adding name and ship_type_name to an event row
+
+    Names are reloaded at most once per request when a ship is missing. Rows
+    for ships that are still missing are dropped, as the join on ships used to.
+
+    Args:
+        conn: The request's database connection, which is also used while
+              streaming the response
+
+    Returns:
+        function: add(row) -> row dict with mmsi, name and ship_type_name
+                  first, or None for an unknown ship
+    """
+    names = get_ship_names(conn)
+    refreshed = False
+
+    def add(row):
+        nonlocal names, refreshed
+        mmsi = row['mmsi']
+        if mmsi not in names and not refreshed:
+            names = get_ship_names(conn, refresh=True)
+            refreshed = True
+        if mmsi not in names:
+            return None
+        name, ship_type_name = names[mmsi]
+        return {'mmsi': mmsi, 'name': name, 'ship_type_name': ship_type_name, **row}
+
+    return add
 
 @app.route('/api/crossings')
 def api_crossings():
-    """Get all crossing events"""
-    conn = get_db()
-    cursor = conn.cursor()
+    """Get the latest crossing events"""
+    add_ship_name = ship_name_adder(get_db())
+    cursor = stream_cursor('crossings')
 
     cursor.execute('''
-        SELECT
-            c.mmsi,
-            s.name,
-            s.ship_type_name,
-            c.crossing_time,
-            c.crossing_lat,
-            c.crossing_lon,
-            c.direction
-        FROM crossings c
-        JOIN ships s ON c.mmsi = s.mmsi
-        ORDER BY c.crossing_time DESC
+        SELECT mmsi, crossing_time, crossing_lat, crossing_lon, direction
+        FROM crossings
+        ORDER BY crossing_time DESC
         LIMIT 1000
     ''')
 
-    crossings = []
-    for row in cursor.fetchall():
-        crossing = dict(row)
-        # Handle null/empty ship names
-        if not crossing.get('name') or crossing['name'].strip() == '':
-            crossing['name'] = f"Ukjent ({crossing['mmsi']})"
-        if not crossing.get('ship_type_name') or crossing['ship_type_name'] == 'Type 0':
-            crossing['ship_type_name'] = 'Ukjent'
-        crossings.append(crossing)
-
-    conn.close()
-
-    return jsonify(crossings)
+    return stream_json_array(cursor, add_ship_name)
 
 @app.route('/api/waiting')
 def api_waiting():
-    """Get waiting events"""
-    conn = get_db()
-    cursor = conn.cursor()
+    """Get the latest waiting events, at most ?limit= (default 5000)"""
+    limit = max(1, request.args.get('limit', 5000, type=int))
+    add_ship_name = ship_name_adder(get_db())
+    cursor = stream_cursor('waiting')
 
-    cursor.execute('''
+    cursor.execute(f'''
         SELECT
-            w.mmsi,
-            s.name,
-            s.ship_type_name,
-            w.zone,
-            w.start_time,
-            w.end_time,
-            w.duration_minutes,
-            w.avg_speed,
-            w.crossed,
-            w.crossing_time
-        FROM waiting_events w
-        JOIN ships s ON w.mmsi = s.mmsi
-        ORDER BY w.start_time DESC
-    ''')
-
-    waiting = []
-    for row in cursor.fetchall():
-        event = dict(row)
-        # Handle null/empty ship names
-        if not event.get('name') or event['name'].strip() == '':
-            event['name'] = f"Ukjent ({event['mmsi']})"
-        if not event.get('ship_type_name') or event['ship_type_name'] == 'Type 0':
-            event['ship_type_name'] = 'Ukjent'
-        waiting.append(event)
-
-    conn.close()
-
-    return jsonify(waiting)
+            mmsi,
+            zone,
+            start_time,
+            end_time,
+            duration_minutes,
+            avg_speed,
+            crossed,
+            crossing_time
+        FROM waiting_events
+        ORDER BY start_time DESC
+        LIMIT {PARAM}
+    ''', (limit,))
+
+    return stream_json_array(cursor, add_ship_name)
 
 @app.route('/api/daily-stats')
 def api_daily_stats():
     """Get daily statistics for charts"""
+    return cached_json('daily_stats', 300, _compute_daily_stats)
+
+def _compute_daily_stats():
+    """Daily statistics for /api/daily-stats, oldest first"""
     conn = get_db()
     cursor = conn.cursor()
 
@@ -343,127 +588,104 @@ def api_daily_stats():
         LIMIT 90
     ''')
 
-    stats = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    stats = fetch_dicts(cursor)
 
     # Reverse to get chronological order for charts
     stats.reverse()
 
-    return jsonify(stats)
+    return stats
+
+# Latest position for each ship in the last 48 hours with last crossing info,
+# read from the latest_positions table the collector maintains
+_ACTIVE_SHIPS_SQL = f'''
+    WITH last_crossings AS (
+        SELECT
+            mmsi,
+            crossing_time as last_crossing_time,
+            direction as last_direction
+        FROM (
+            SELECT
+                mmsi,
+                crossing_time,
+                direction,
+                ROW_NUMBER() OVER (PARTITION BY mmsi ORDER BY crossing_time DESC) as rn
+            FROM crossings
+        ) ranked_crossings
+        WHERE rn = 1
+    )
+    SELECT
+        s.mmsi,
+        {SHIP_NAME_COLUMN},
+        {SHIP_TYPE_COLUMN},
+        s.destination,
+        s.callsign,
+        s.length,
+        s.width,
+        lp.latitude,
+        lp.longitude,
+        lp.sog,
+        lp.cog,
+        lp.heading,
+        lp.timestamp,
+        lc.last_crossing_time,
+        lc.last_direction
+    FROM {{latest_positions}} lp
+    JOIN ships s ON lp.mmsi = s.mmsi
+    LEFT JOIN last_crossings lc ON lp.mmsi = lc.mmsi
+    WHERE lp.timestamp > {LAST_48H}
+    ORDER BY lp.timestamp DESC
+'''
+ACTIVE_SHIPS_SQL = _ACTIVE_SHIPS_SQL.format(latest_positions='latest_positions')
+# Until the collector has created latest_positions (after a deploy), the
+# latest positions are searched for in positions instead
+ACTIVE_SHIPS_FALLBACK_SQL = _ACTIVE_SHIPS_SQL.format(latest_positions=f'''(
+        SELECT mmsi, latitude, longitude, sog, cog, heading, timestamp
+        FROM (
+            SELECT
+                mmsi, latitude, longitude, sog, cog, heading, timestamp,
+                ROW_NUMBER() OVER (PARTITION BY mmsi ORDER BY timestamp DESC) as rn
+            FROM positions
+            WHERE timestamp > {LAST_48H}
+        ) ranked_positions
+        WHERE rn = 1
+    )''')
+_has_latest_positions = False
 
 @app.route('/api/active-ships')
 def api_active_ships():
     """Get currently active ships with their latest position"""
+    # Short TTL: mostly so a burst of dashboard visitors shares one query
+    return cached_json('active_ships', 10, _compute_active_ships)
+
+def _compute_active_ships():
+    """Ships seen in the last 48 hours for /api/active-ships, newest first"""
+    global _has_latest_positions
     conn = get_db()
     cursor = conn.cursor()
 
-    # Get latest position for each ship in the last 48 hours with last crossing info
-    cursor.execute('''
-        WITH latest_positions AS (
-            SELECT
-                p.mmsi,
-                p.latitude,
-                p.longitude,
-                p.sog,
-                p.cog,
-                p.heading,
-                p.timestamp,
-                ROW_NUMBER() OVER (PARTITION BY p.mmsi ORDER BY p.timestamp DESC) as rn
-            FROM positions p
-            WHERE p.timestamp > datetime('now', '-48 hours')
-        ),
-        last_crossings AS (
-            SELECT
-                mmsi,
-                MAX(crossing_time) as last_crossing_time,
-                (SELECT direction FROM crossings c2
-                 WHERE c2.mmsi = crossings.mmsi
-                 ORDER BY crossing_time DESC LIMIT 1) as last_direction
-            FROM crossings
-            GROUP BY mmsi
-        )
-        SELECT
-            s.mmsi,
-            s.name,
-            s.ship_type_name,
-            s.destination,
-            s.callsign,
-            s.length,
-            s.width,
-            lp.latitude,
-            lp.longitude,
-            lp.sog,
-            lp.cog,
-            lp.heading,
-            lp.timestamp,
-            lc.last_crossing_time,
-            lc.last_direction
-        FROM latest_positions lp
-        JOIN ships s ON lp.mmsi = s.mmsi
-        LEFT JOIN last_crossings lc ON lp.mmsi = lc.mmsi
-        WHERE lp.rn = 1
-        ORDER BY lp.timestamp DESC
-    ''' if not USE_POSTGRES else '''
-        WITH latest_positions AS (
-            SELECT
-                p.mmsi,
-                p.latitude,
-                p.longitude,
-                p.sog,
-                p.cog,
-                p.heading,
-                p.timestamp,
-                ROW_NUMBER() OVER (PARTITION BY p.mmsi ORDER BY p.timestamp DESC) as rn
-            FROM positions p
-            WHERE p.timestamp > NOW() - INTERVAL '48 hours'
-        ),
-        last_crossings AS (
-            SELECT
-                mmsi,
-                MAX(crossing_time) as last_crossing_time,
-                (SELECT direction FROM crossings c2
-                 WHERE c2.mmsi = crossings.mmsi
-                 ORDER BY crossing_time DESC LIMIT 1) as last_direction
-            FROM crossings
-            GROUP BY mmsi
-        )
-        SELECT
-            s.mmsi,
-            s.name,
-            s.ship_type_name,
-            s.destination,
-            s.callsign,
-            s.length,
-            s.width,
-            lp.latitude,
-            lp.longitude,
-            lp.sog,
-            lp.cog,
-            lp.heading,
-            lp.timestamp,
-            lc.last_crossing_time,
-            lc.last_direction
-        FROM latest_positions lp
-        JOIN ships s ON lp.mmsi = s.mmsi
-        LEFT JOIN last_crossings lc ON lp.mmsi = lc.mmsi
-        WHERE lp.rn = 1
-        ORDER BY lp.timestamp DESC
-    ''')
+    if not _has_latest_positions:
+        cursor.execute(LATEST_POSITIONS_EXISTS)
+        _has_latest_positions = bool(fetch_dicts(cursor)[0]['present'])
+    cursor.execute(ACTIVE_SHIPS_SQL if _has_latest_positions else ACTIVE_SHIPS_FALLBACK_SQL)
 
-    ships = []
-    for row in cursor.fetchall():
-        ship = dict(row)
-        # Handle null/empty ship names
-        if not ship.get('name') or ship['name'].strip() == '':
-            ship['name'] = f"Ukjent ({ship['mmsi']})"
-        # Handle unknown ship types
-        if not ship.get('ship_type_name') or ship['ship_type_name'] == 'Type 0':
-            ship['ship_type_name'] = 'Ukjent'
-        ships.append(ship)
+    ships = fetch_dicts(cursor)
 
-    conn.close()
+    return ships
 
-    return jsonify(ships)
+# Ship info for /api/tracks (without the collector's lookup bookkeeping)
+TRACK_SHIP_SQL = f'''
+    SELECT mmsi, name, ship_type, ship_type_name, destination, callsign, length, width
+    FROM ships
+    WHERE mmsi = {PARAM}
+'''
+
+TRACK_POSITIONS_SQL = f'''
+    SELECT timestamp, latitude, longitude, sog, cog, heading
+    FROM positions
+    WHERE mmsi = {PARAM}
+    ORDER BY timestamp
+    LIMIT 5000
+'''
 
 @app.route('/api/tracks/<int:mmsi>')
 def api_tracks(mmsi):
@@ -471,27 +693,11 @@ def api_tracks(mmsi):
     conn = get_db()
     cursor = conn.cursor()
 
-    # Get ship info
-    cursor.execute('SELECT * FROM ships WHERE mmsi = %s' if USE_POSTGRES else 'SELECT * FROM ships WHERE mmsi = ?', (mmsi,))
-    ship = dict(cursor.fetchone() or {})
+    cursor.execute(TRACK_SHIP_SQL, (mmsi,))
+    ship = (fetch_dicts(cursor) or [{}])[0]
 
-    # Get positions
-    cursor.execute('''
-        SELECT timestamp, latitude, longitude, sog, cog, heading
-        FROM positions
-        WHERE mmsi = %s
-        ORDER BY timestamp
-        LIMIT 5000
-    ''' if USE_POSTGRES else '''
-        SELECT timestamp, latitude, longitude, sog, cog, heading
-        FROM positions
-        WHERE mmsi = ?
-        ORDER BY timestamp
-        LIMIT 5000
-    ''', (mmsi,))
-
-    positions = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    cursor.execute(TRACK_POSITIONS_SQL, (mmsi,))
+    positions = fetch_dicts(cursor)
 
     return jsonify({
         'ship': ship,
@@ -501,6 +707,10 @@ def api_tracks(mmsi):
 @app.route('/api/weather')
 def api_weather():
     """Get recent weather data"""
+    return cached_json('weather', 300, _compute_weather)
+
+def _compute_weather():
+    """Recent weather observations for /api/weather, oldest first"""
     conn = get_db()
     cursor = conn.cursor()
 
@@ -511,13 +721,12 @@ def api_weather():
         LIMIT 1000
     ''')
 
-    weather = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    weather = fetch_dicts(cursor)
 
     # Reverse for chronological order
     weather.reverse()
 
-    return jsonify(weather)
+    return weather
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))